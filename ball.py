@@ -1,92 +1,221 @@
-import pygame
+import gc
 import math
 import random
 
+from game.ccd import sweep_box_against_rect, sweep_box_against_bat, sweep_circle_against_rect, sweep_circle_against_bat
+from game.circle import circle_against_rect, circle_against_bat
+from game.rect import Rect
+
+# balls have always been 10 pixels across
+BALL_RADIUS = 5.0
+
 
 class Ball:
+    # fixed slots rather than a per-ball __dict__, as there can be a great many balls
+    __slots__ = ('ball_speed', 'velocity', 'rect', 'ball_colour', 'position', 'start_position',
+                 'max_bat_bounce_angle', 'collided_with_things', 'terminal_velocity', 'number_of_bounces', 'verts',
+                 'previous_position', 'asleep', 'still_steps', 'radius')
 
-    def __init__(self, start_pos, colour):
+    # how far continuous collision lets a ball sink into whatever it hits
+    contact_depth = 1.0
+
+    def __init__(self, start_pos, colour, rng=random, radius=BALL_RADIUS):
+        # rng is where the random start direction comes from - a world passes its own random.Random so that its
+        # runs don't depend on whatever else has drawn from the random module
         self.ball_speed = 350.0
-        random_vec = self.make_random_start_vector()
+        random_vec = self.make_random_start_vector(rng)
         self.velocity = [random_vec[0] * self.ball_speed, random_vec[1] * self.ball_speed]
-        self.rect = pygame.Rect((start_pos[0]-5, start_pos[1]-5), (10, 10))
+        # the ball is a circle of this radius when it collides as one, and either way its rect is the box around it
+        self.radius = radius
+        self.rect = Rect((start_pos[0] - radius, start_pos[1] - radius), (2 * radius, 2 * radius))
         self.ball_colour = colour
         self.position = [float(start_pos[0]), float(start_pos[1])]
         self.start_position = [self.position[0], self.position[1]]
+        # where the ball was before its last move, for drawing it part way between steps
+        self.previous_position = [self.position[0], self.position[1]]
+
+        # a ball that has sat perfectly still for a few steps is left out of the update until something moves it
+        self.asleep = False
+        self.still_steps = 0
 
         self.max_bat_bounce_angle = 5.0 * math.pi / 12.0  # 75 degrees
 
-        self.collided_with_things = []
+        self.collided_with_things = set()
 
         self.terminal_velocity = 20.0
         self.number_of_bounces = 0
 
-        self.verts = []
-        self.verts.append(self.rect.topleft)
-        self.verts.append(self.rect.topright)
-        self.verts.append(self.rect.bottomleft)
-        self.verts.append(self.rect.bottomright)
+        # top left, top right, bottom left, bottom right - updated in place as the ball moves
+        self.verts = [[0, 0], [0, 0], [0, 0], [0, 0]]
+        self.update_verts()
+
+    @classmethod
+    def many(cls, positions, colours, velocities=None, rng=random, radii=None):
+        """
+        Makes a ball at each of positions in one go - the same balls as calling Ball() for each, random start
+        velocities and all unless velocities are given, but without the per-call overhead, which adds up over tens
+        of thousands of balls.
+        """
+        if radii is None:
+            radii = [BALL_RADIUS] * len(positions)
+        if velocities is None:
+            velocities = []
+            for _ in range(len(positions)):
+                random_vec = cls.make_random_start_vector(rng)
+                velocities.append((random_vec[0] * 350.0, random_vec[1] * 350.0))
+
+        balls = []
+        new = cls.__new__
+        max_bat_bounce_angle = 5.0 * math.pi / 12.0
+        # every ball is half a dozen new containers, which keeps setting off the garbage collector to look through
+        # all of the balls made so far - none of them can be garbage yet, so it's paused until they're all made
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            for (x, y), colour, (velocity_x, velocity_y), radius in zip(positions, colours, velocities, radii):
+                ball = new(cls)
+                ball.ball_speed = 350.0
+                ball.velocity = [velocity_x, velocity_y]
+                ball.radius = radius
+                ball.rect = rect = Rect(x - radius, y - radius, 2 * radius, 2 * radius)
+                ball.ball_colour = colour
+                ball.position = [x, y]
+                ball.start_position = [x, y]
+                ball.previous_position = [x, y]
+                ball.asleep = False
+                ball.still_steps = 0
+                ball.max_bat_bounce_angle = max_bat_bounce_angle
+                ball.collided_with_things = set()
+                ball.terminal_velocity = 20.0
+                ball.number_of_bounces = 0
+                left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+                ball.verts = [[left, top], [right, top], [left, bottom], [right, bottom]]
+                balls.append(ball)
+        finally:
+            if collecting:
+                gc.enable()
+        return balls
+
+    @property
+    def edges(self):
+        # only the separating axis test needs these, so they are made from the verts when it asks for them
+        top_left, top_right, bottom_left, bottom_right = self.verts
+        return [[top_left, top_right], [top_left, bottom_left],
+                [bottom_right, top_right], [bottom_right, bottom_left]]
 
-        self.edges = []
-        self.edges.append([self.rect.topleft, self.rect.topright])
-        self.edges.append([self.rect.topleft, self.rect.bottomleft])
-        self.edges.append([self.rect.bottomright, self.rect.topright])
-        self.edges.append([self.rect.bottomright, self.rect.bottomleft])
+    def update_verts(self):
+        left, top, right, bottom = self.rect.left, self.rect.top, self.rect.right, self.rect.bottom
+        top_left, top_right, bottom_left, bottom_right = self.verts
+        top_left[0] = left
+        top_left[1] = top
+        top_right[0] = right
+        top_right[1] = top
+        bottom_left[0] = left
+        bottom_left[1] = bottom
+        bottom_right[0] = right
+        bottom_right[1] = bottom
 
     @staticmethod
-    def make_random_start_vector():
+    def make_random_start_vector(rng=random):
         # make a normalised angle aiming roughly toward one of the goals
-        y_random = random.uniform(-0.5, 0.5)
+        y_random = rng.uniform(-0.5, 0.5)
         x_random = 1.0 - abs(y_random)
 
-        if random.randint(0, 1) == 1:
+        if rng.randint(0, 1) == 1:
             x_random = x_random * -1.0
         
         return [x_random, y_random]
 
-    def reset(self):
+    def reset(self, rng=random):
         self.number_of_bounces = 0
         self.position = [self.start_position[0], self.start_position[1]]
-        random_vec = self.make_random_start_vector()
+        self.previous_position = [self.position[0], self.position[1]]
+        self.asleep = False
+        self.still_steps = 0
+        random_vec = self.make_random_start_vector(rng)
         self.velocity = [random_vec[0] * self.ball_speed, random_vec[1] * self.ball_speed]
         self.rect.x = self.position[0]
         self.rect.y = self.position[1]
 
-    def update(self, dt, gravity, walls, bats):
+    def update(self, dt, gravity, walls, bats, bat_hits=None, circle=True):
+        """
+        bat_hits can carry the results of a batched collision test against the bats (see respond) so the ball
+        doesn't have to run the test itself.
+        """
+        self.respond(dt, gravity, walls, bats, bat_hits, circle)
+        self.move(dt)
+
+    def respond(self, dt, gravity, walls, bats, bat_hits=None, circle=True):
+        """
+        Bounces the ball off anything it is touching. With circle the ball is a circle of its radius, tested with
+        the quick circle contact tests and bounced off the normal at the point of contact, so a ball clipping the end
+        of a bat goes off at an angle rather than as if it had hit the bat's face. Otherwise it is its box, tested
+        against bats with the separating axis test and always bounced off a bat's face or a wall's long side.
+
+        bat_hits, from a batched test, has one entry per bat: True/False for a box, or for a circle the contact
+        normal, None where it misses.
+        """
         collided_this_frame = False
         collided_horiz_this_frame = False
+        if circle:
+            centre_x = self.position[0] + self.radius
+            centre_y = self.position[1] + self.radius
+
         for wall in walls:
-            if self.rect.colliderect(wall.rect):
-                collided_this_frame = True
-                if wall not in self.collided_with_things:
-                    self.collided_with_things.append(wall)
+            if circle:
+                contact = circle_against_rect(centre_x, centre_y, self.radius, wall.rect)
+                if contact is None:
+                    continue
+            elif not self.rect.colliderect(wall.rect):
+                continue
+
+            collided_this_frame = True
+            if wall not in self.collided_with_things:
+                self.collided_with_things.add(wall)
 
-                    if wall.is_horiz:
-                        # this does basic bounce reflection depending on if the wall is horizontal or vertical
-                        self.velocity[1] = self.velocity[1] * -1
+                if circle:
+                    _, normal_x, normal_y = contact
+                    # off a wall's side this is the same as flipping one half of the velocity, as below
+                    along_normal = 2.0 * (self.velocity[0] * normal_x + self.velocity[1] * normal_y)
+                    self.velocity[0] = self.velocity[0] - along_normal * normal_x
+                    self.velocity[1] = self.velocity[1] - along_normal * normal_y
+                    if abs(normal_y) >= abs(normal_x):
                         collided_horiz_this_frame = True
-                    else:
-                        # this does basic bounce reflection depending on if the wall is horizontal or vertical
-                        self.velocity[0] = self.velocity[0] * -1 
+                elif wall.is_horiz:
+                    # this does basic bounce reflection depending on if the wall is horizontal or vertical
+                    self.velocity[1] = self.velocity[1] * -1
+                    collided_horiz_this_frame = True
+                else:
+                    # this does basic bounce reflection depending on if the wall is horizontal or vertical
+                    self.velocity[0] = self.velocity[0] * -1
 
-                    # this scales our bounce by the ball's bounciness
-                    self.velocity[1] = self.velocity[1] * wall.bounce_factor
-                    self.velocity[0] = self.velocity[0] * wall.bounce_factor
+                # this scales our bounce by the ball's bounciness
+                self.velocity[1] = self.velocity[1] * wall.bounce_factor
+                self.velocity[0] = self.velocity[0] * wall.bounce_factor
 
-                    self.number_of_bounces += 1
+                self.number_of_bounces += 1
 
-        for bat in bats:
-            if bat.collide_polygon_with_polygon(bat, self):
+        if bat_hits is None:
+            if circle:
+                bat_hits = [self.circle_contact_normal(centre_x, centre_y, bat) for bat in bats]
+            else:
+                bat_hits = [bat.bounds_overlap(self.rect) and bat.collide_polygon_with_polygon(bat, self)
+                            for bat in bats]
+
+        for bat, hit in zip(bats, bat_hits):
+            if hit:
                 collided_this_frame = True
                 if bat not in self.collided_with_things:
-                    self.collided_with_things.append(bat)
+                    self.collided_with_things.add(bat)
                     
                     collided_horiz_this_frame = True
 
-                    v_n = self.dot(self.velocity, bat.normal_vec)
-                    n_n = self.dot(bat.normal_vec, bat.normal_vec)
+                    # a circle's hit is the normal where it touched, a box always bounces off the bat's face
+                    normal = hit if circle else bat.normal_vec
+                    v_n = self.dot(self.velocity, normal)
+                    n_n = self.dot(normal, normal)
                     u_div = (v_n / n_n)
-                    u = [u_div * bat.normal_vec[0], u_div * bat.normal_vec[1]]
+                    u = [u_div * normal[0], u_div * normal[1]]
                     w = [self.velocity[0] - u[0], self.velocity[1] - u[1]]
 
                     friction = 1
@@ -121,27 +250,86 @@ class Ball:
                 # remove any Bounces added this frame because we are barely moving
                 self.number_of_bounces -= 1
 
+    def circle_contact_normal(self, centre_x, centre_y, bat):
+        # however it has turned, no part of the bat is further than half its width plus half its height from its
+        # centre in x or y - this goes by the bat's position rather than its bounds, as they aren't worked out until
+        # it first moves
+        reach = (bat.width + bat.height) / 2 + self.radius
+        if abs(centre_x - bat.position[0]) >= reach or abs(centre_y - bat.position[1]) >= reach:
+            return None
+        contact = circle_against_bat(centre_x, centre_y, self.radius, bat)
+        if contact is None:
+            return None
+        return contact[1], contact[2]
+
+    def move(self, dt, walls=None, bats=None, circle=True):
+        """
+        Applies the ball's velocity to its position. Passing walls and bats turns on continuous collision - the move
+        is cut short just inside the first thing the ball would hit along the way, so it can't tunnel through
+        anything however big dt is, and the bounce happens as normal in the next respond(). circle should be what
+        respond() is given, so the ball is swept as the same shape it is bounced as.
+        """
+        self.previous_position[0] = self.position[0]
+        self.previous_position[1] = self.position[1]
+
+        move_x = dt * self.velocity[0]
+        move_y = dt * self.velocity[1]
+
+        if walls is not None or bats is not None:
+            fraction = self.first_contact(move_x, move_y, walls or [], bats or [], circle)
+            move_x *= fraction
+            move_y *= fraction
+
         # apply our ball's velocity to it's position
-        self.position[0] = self.position[0] + dt * self.velocity[0]
-        self.position[1] = self.position[1] + dt * self.velocity[1]
+        self.position[0] = self.position[0] + move_x
+        self.position[1] = self.position[1] + move_y
         self.rect.x = self.position[0]
         self.rect.y = self.position[1]
+        self.update_verts()
 
-        self.verts[:] = []
-        self.verts.append(self.rect.topleft)
-        self.verts.append(self.rect.topright)
-        self.verts.append(self.rect.bottomleft)
-        self.verts.append(self.rect.bottomright)
+    def first_contact(self, move_x, move_y, walls, bats, circle=True):
+        move = (move_x, move_y)
+        if circle:
+            centre = (self.position[0] + self.radius, self.position[1] + self.radius)
+        else:
+            half_size = (self.rect.width / 2, self.rect.height / 2)
+            centre = (self.position[0] + half_size[0], self.position[1] + half_size[1])
 
-        self.edges[:] = []
-        self.edges.append([self.rect.topleft, self.rect.topright])
-        self.edges.append([self.rect.topleft, self.rect.bottomleft])
-        self.edges.append([self.rect.bottomright, self.rect.topright])
-        self.edges.append([self.rect.bottomright, self.rect.bottomleft])
+        earliest = None
+        for wall in walls:
+            if wall not in self.collided_with_things:
+                if circle:
+                    time_of_impact = sweep_circle_against_rect(centre, self.radius, move, wall.rect)
+                else:
+                    time_of_impact = sweep_box_against_rect(centre, half_size, move, wall.rect)
+                if time_of_impact is not None and (earliest is None or time_of_impact < earliest):
+                    earliest = time_of_impact
+
+        for bat in bats:
+            if bat not in self.collided_with_things:
+                if circle:
+                    time_of_impact = sweep_circle_against_bat(centre, self.radius, move, bat)
+                else:
+                    time_of_impact = sweep_box_against_bat(centre, half_size, move, bat)
+                if time_of_impact is not None and (earliest is None or time_of_impact < earliest):
+                    earliest = time_of_impact
+
+        if earliest is None:
+            return 1.0
+
+        # stop a little way into the collider so the overlap test definitely picks it up next time round
+        distance = math.sqrt(move_x ** 2 + move_y ** 2)
+        return min(1.0, earliest + self.contact_depth / distance)
 
     def render(self, screen):
+        import pygame
         pygame.draw.rect(screen, self.ball_colour, self.rect)
 
+    def interpolated_position(self, alpha):
+        # the top left corner alpha of the way from where the ball was before its last move to where it is now
+        return (round(self.previous_position[0] + (self.position[0] - self.previous_position[0]) * alpha),
+                round(self.previous_position[1] + (self.position[1] - self.previous_position[1]) * alpha))
+
     @staticmethod
     def dot(vec_1, vec_2):
         product = vec_1[0] * vec_2[0] + vec_1[1] * vec_2[1]
@@ -1,15 +1,39 @@
 import pygame
 from pygame.locals import *
 
-from game.wall import Wall
-from game.bat import Bat, ControlScheme
+from game.world import BounceWorld
+from game.profile_overlay import ProfileOverlay
+from game.renderer import StampCache, DirtyRectRenderer
+from sim.profiling import PhaseTimer
+from sim.clock import FixedStepClock
+from sim.scene import load_scene
 
 from ball import Ball
 
-import random
+import argparse
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Bounce Physics')
+    parser.add_argument('--profile', action='store_true', help='time each phase of the update and show it on screen')
+    parser.add_argument('--trace', help='save a Chrome trace of every frame to this file on exit')
+    parser.add_argument('--prewarm-sprites', action='store_true',
+                        help='make every rotated bat sprite at startup instead of as the bats first turn')
+    parser.add_argument('--full-redraw', action='store_true',
+                        help='draw everything one shape at a time and flip the whole window each frame')
+    parser.add_argument('--scene', help='load the walls, bats and balls from this scene file')
+    parser.add_argument('--seed', type=int, default=None, help='seed the world\'s random numbers')
+    parser.add_argument('--lockstep', action='store_true',
+                        help='run exactly one physics step per frame, so a seeded run replays the same every time')
+    args = parser.parse_args()
+
+    if args.scene:
+        try:
+            world = load_scene(args.scene, 'bounce', seed=args.seed)
+        except ValueError as error:
+            parser.error(str(error))
+    else:
+        world = BounceWorld.default(seed=args.seed)
    
     pygame.init()
     pygame.display.set_caption('Bounce Physics')
@@ -21,22 +45,24 @@ def main():
     
     font = pygame.font.Font(None, 26) 
 
-    walls = [Wall((10, 10), (790, 20)), Wall((10, 580), (790, 590)),
-             Wall((10, 10), (20, 590)), Wall((780, 10), (790, 590))]
+    if args.prewarm_sprites:
+        for bat in world.bats:
+            bat.prewarm_sprites()
 
-    bats = []
+    overlay = None
+    if args.profile or args.trace:
+        world.timer = PhaseTimer(trace=args.trace is not None)
+        if args.profile:
+            overlay = ProfileOverlay(world.timer, (620, 55), "#FFFFFF")
 
-    control_scheme1 = ControlScheme()
-    control_scheme1.left = K_LEFT
-    control_scheme1.right = K_RIGHT
-
-    bats.append(Bat((400, 500), control_scheme1))
-
-    balls = [Ball((400, 300), pygame.Color("#FFFFFF"))]
+    stamps = StampCache()
+    renderer = DirtyRectRenderer(screen, background)
+    renderer.add_static(world.render_static)
 
     clock = pygame.time.Clock() 
+    # physics always moves on in fixed steps, so a slow frame means more steps rather than one big one
+    sim_clock = FixedStepClock(1 / 60, lockstep=args.lockstep)
 
-    gravity = [0.0, 400.0]
     running = True  
     while running:
 
@@ -49,40 +75,48 @@ def main():
 
             if event.type == KEYDOWN:
                 if event.key == K_r:
-                    for ball in balls:
-                        ball.reset()
+                    world.reset_balls()
 
                 if event.key == K_SPACE:
-                    x_pos = random.randint(20, 780)
-                    y_pos = random.randint(20, 580)
+                    x_pos = world.rng.randint(20, 780)
+                    y_pos = world.rng.randint(20, 580)
                     ball_colour = pygame.Color("#000000")
-                    ball_colour.r = random.randint(100, 255)
-                    ball_colour.g = random.randint(100, 255)
-                    ball_colour.b = random.randint(100, 255)
-                    balls.append(Ball((x_pos, y_pos), ball_colour))
+                    ball_colour.r = world.rng.randint(100, 255)
+                    ball_colour.g = world.rng.randint(100, 255)
+                    ball_colour.b = world.rng.randint(100, 255)
+                    world.balls.append(Ball((x_pos, y_pos), ball_colour, world.rng))
 
-            for bat in bats:
+            for bat in world.bats:
                 bat.process_event(event)
                         
-        screen.blit(background, (0, 0))  # draw the background surface to our screen
-
-        for wall in walls:
-            wall.render(screen)
-
-        for bat in bats:
-            bat.update(time_delta)
-            bat.render(screen)
-
-        total_ball_bounces = 0
-        for ball in balls:
-            ball.update(time_delta, gravity, walls, bats)
-            total_ball_bounces += ball.number_of_bounces
-            ball.render(screen)
-
-        bounce_text = font.render("Bounces: " + str(total_ball_bounces), True, pygame.Color("#FFFFFF"))
-        screen.blit(bounce_text, bounce_text.get_rect(x=650, y=30))
-                
-        pygame.display.flip()  # flip all our drawn stuff onto the screen
+        for _ in range(sim_clock.advance(time_delta)):
+            world.step(sim_clock.step)
+
+        with world.timer.phase('render'):
+            total_ball_bounces = world.total_bounces()
+            bounce_text = font.render("Bounces: " + str(total_ball_bounces), True, pygame.Color("#FFFFFF"))
+
+            if args.full_redraw:
+                screen.blit(background, (0, 0))  # draw the background surface to our screen
+                world.render(screen)
+                screen.blit(bounce_text, bounce_text.get_rect(x=650, y=30))
+                if overlay is not None:
+                    overlay.render(screen)
+
+                pygame.display.flip()  # flip all our drawn stuff onto the screen
+            else:
+                # only the parts of the window that changed get redrawn and sent to the display
+                renderer.begin()
+                renderer.draw(world.sprites(stamps, sim_clock.alpha))
+                renderer.mark([screen.blit(bounce_text, bounce_text.get_rect(x=650, y=30))])
+                if overlay is not None:
+                    renderer.mark(overlay.render(screen))
+                renderer.end()
+
+        world.timer.frame()
+
+    if args.trace:
+        world.timer.export_chrome_trace(args.trace)
 
 
 if __name__ == '__main__':
@@ -1,17 +1,34 @@
 import math
-import pygame
-from pygame.locals import *
+
+from game.rect import Rect
+from game.sprite_cache import BAT_SPRITES
 
 
 class ControlScheme:
-    def __init__(self):
-        self.left = K_LEFT
-        self.right = K_RIGHT
-        self.up = K_UP
-        self.down = K_DOWN
+    # the names of pygame's key constants rather than the keys themselves, so making a bat doesn't need pygame -
+    # they're looked up when the first key event comes in
+    def __init__(self, left='K_LEFT', right='K_RIGHT', up='K_UP', down='K_DOWN'):
+        self.left = left
+        self.right = right
+        self.up = up
+        self.down = down
+        self._keys = None
+
+    def keys(self):
+        """
+        The pygame key codes for left, right, up and down.
+        """
+        if self._keys is None:
+            import pygame
+            self._keys = tuple(getattr(pygame, name) for name in (self.left, self.right, self.up, self.down))
+        return self._keys
 
 
 class Bat:
+    __slots__ = ('control_scheme', 'move_left', 'move_right', 'rotate_left', 'rotate_right', 'move_speed',
+                 'height', 'width', 'rotation', 'bounce_factor', 'position', 'verts', 'axes', 'bounds', 'rect',
+                 'bat_colour', 'color_key', 'draw_surface', 'sprite_key', 'start_normal_vec', 'normal_vec',
+                 'previous_position', 'previous_rotation')
 
     def __init__(self, start_pos, control_scheme):
         self.control_scheme = control_scheme
@@ -29,37 +46,31 @@ class Bat:
         self.bounce_factor = 1.1
 
         self.position = [float(start_pos[0]), float(start_pos[1])]
+        # where the bat was before its last update, for drawing it part way between steps
+        self.previous_position = [self.position[0], self.position[1]]
+        self.previous_rotation = 0.0
 
+        # top left, top right, bottom left, bottom right - updated in place whenever the bat moves or rotates
         self.verts = [[start_pos[0], start_pos[1]],
                       [start_pos[0] + self.width, start_pos[1]],
-                      [start_pos[0] + self.width, start_pos[1] + self.height],
-                      [start_pos[0], start_pos[1] + self.height]]
+                      [start_pos[0], start_pos[1] + self.height],
+                      [start_pos[0] + self.width, start_pos[1] + self.height]]
 
-        self.edges = [[self.verts[0], self.verts[1]],
-                      [self.verts[1], self.verts[2]],
-                      [self.verts[2], self.verts[3]],
-                      [self.verts[3], self.verts[0]]]
+        # the directions the bat's edges face, for the separating axis test
+        self.axes = [[1.0, 0.0], [0.0, 1.0]]
+        self.bounds = (0.0, 0.0, 0.0, 0.0)
+        self.update_bounding_box()
         
-        self.rect = pygame.Rect((start_pos[0]-self.width/2, start_pos[1]), (self.width, self.height))
+        self.rect = Rect((start_pos[0]-self.width/2, start_pos[1]), (self.width, self.height))
         self.rect.centerx = self.position[0]
         self.rect.centery = self.position[1]
-        self.bat_colour = pygame.Color("#FFFFFF")
+        self.bat_colour = (255, 255, 255, 255)
 
         self.color_key = (127, 33, 33)
-        self.draw_surface = pygame.Surface((self.rect.width, self.rect.height))
-        self.final_draw_surface = pygame.Surface((self.rect.width, self.rect.height))
-
-        self.draw_surface.fill(self.color_key)
-        self.draw_surface.set_colorkey(self.color_key)
-        pygame.draw.rect(self.draw_surface,
-                         self.bat_colour,
-                         pygame.Rect(0,
-                                     0,
-                                     self.rect.width,
-                                     self.rect.height))
-        self.draw_surface.set_alpha(255)
-        self.final_draw_surface = pygame.transform.rotate(self.draw_surface,
-                                                          (self.rotation * 180 / math.pi))
+        # made the first time the bat is drawn, as it needs pygame
+        self.draw_surface = None
+        # bats that look the same share their rotated sprites
+        self.sprite_key = ('bat', self.rect.width, self.rect.height, tuple(self.bat_colour))
 
         self.start_normal_vec = [0.0, -1.0]
         self.normal_vec = [0.0, -1.0]
@@ -72,31 +83,35 @@ class Bat:
         self.normal_vec[0] = self.start_normal_vec[0] * cos_rotation - self.start_normal_vec[1] * sin_rotation
         self.normal_vec[1] = self.start_normal_vec[0] * sin_rotation + self.start_normal_vec[1] * cos_rotation
         self.update_real_bounds()
-        self.final_draw_surface = pygame.transform.rotate(self.draw_surface,
-                                                          (self.rotation * 180 / math.pi))
 
     def process_event(self, event):
-        if event.type == KEYDOWN:
-            if event.key == self.control_scheme.left:
+        import pygame
+        left, right, up, down = self.control_scheme.keys()
+        if event.type == pygame.KEYDOWN:
+            if event.key == left:
                 self.move_left = True
-            if event.key == self.control_scheme.right:
+            if event.key == right:
                 self.move_right = True
-            if event.key == self.control_scheme.down:
+            if event.key == down:
                 self.rotate_left = True
-            if event.key == self.control_scheme.up:
+            if event.key == up:
                 self.rotate_right = True
 
-        if event.type == KEYUP:
-            if event.key == self.control_scheme.left:
+        if event.type == pygame.KEYUP:
+            if event.key == left:
                 self.move_left = False
-            if event.key == self.control_scheme.right:
+            if event.key == right:
                 self.move_right = False
-            if event.key == self.control_scheme.down:
+            if event.key == down:
                 self.rotate_left = False
-            if event.key == self.control_scheme.up:
+            if event.key == up:
                 self.rotate_right = False
 
     def update(self, dt):
+        self.previous_position[0] = self.position[0]
+        self.previous_position[1] = self.position[1]
+        self.previous_rotation = self.rotation
+
         if self.move_left:
             self.position[0] -= dt * self.move_speed
 
@@ -121,9 +136,38 @@ class Bat:
             self.rotate(-10 * dt)
 
     def render(self, screen):
-        screen.blit(self.final_draw_surface,
-                    [self.rect.centerx - (self.final_draw_surface.get_width() / 2),
-                     self.rect.centery - (self.final_draw_surface.get_height() / 2)])
+        screen.blit(*self.sprite())
+
+    def sprite(self, alpha=1.0):
+        """
+        The rotated sprite and where it goes, ready for Surface.blits. An alpha below 1 places the bat that far
+        between where it was before its last update and where it is now.
+        """
+        rotation = self.rotation
+        centre_x, centre_y = self.rect.centerx, self.rect.centery
+        if alpha < 1.0:
+            rotation = self.previous_rotation + (self.rotation - self.previous_rotation) * alpha
+            centre_x = round(self.previous_position[0] + (self.position[0] - self.previous_position[0]) * alpha)
+        sprite = BAT_SPRITES.get(self.surface(), self.sprite_key, rotation)
+        return sprite, (centre_x - (sprite.get_width() / 2), centre_y - (sprite.get_height() / 2))
+
+    def prewarm_sprites(self):
+        BAT_SPRITES.prewarm(self.surface(), self.sprite_key)
+
+    def surface(self):
+        if self.draw_surface is None:
+            import pygame
+            self.draw_surface = pygame.Surface((self.rect.width, self.rect.height))
+            self.draw_surface.fill(self.color_key)
+            self.draw_surface.set_colorkey(self.color_key)
+            pygame.draw.rect(self.draw_surface,
+                             self.bat_colour,
+                             pygame.Rect(0,
+                                         0,
+                                         self.rect.width,
+                                         self.rect.height))
+            self.draw_surface.set_alpha(255)
+        return self.draw_surface
 
     def update_real_bounds(self):
         cos_rotation = math.cos(-self.rotation)
@@ -131,33 +175,47 @@ class Bat:
         half_width = self.width / 2
         half_height = self.height / 2
 
-        top_left = [0.0, 0.0]
+        top_left, top_right, bottom_left, bottom_right = self.verts
+
         top_left[0] = self.position[0] + ((-half_width * cos_rotation) - (-half_height * sin_rotation))
         top_left[1] = self.position[1] + ((-half_width * sin_rotation) + (-half_height * cos_rotation))
 
-        top_right = [0.0, 0.0]
         top_right[0] = self.position[0] + ((half_width * cos_rotation) - (-half_height * sin_rotation))
         top_right[1] = self.position[1] + ((half_width * sin_rotation) + (-half_height * cos_rotation))
 
-        bottom_left = [0.0, 0.0]
         bottom_left[0] = self.position[0] + ((-half_width * cos_rotation) - (half_height * sin_rotation))
         bottom_left[1] = self.position[1] + ((-half_width * sin_rotation) + (half_height * cos_rotation))
 
-        bottom_right = [0.0, 0.0]
         bottom_right[0] = self.position[0] + ((half_width * cos_rotation) - (half_height * sin_rotation))
         bottom_right[1] = self.position[1] + ((half_width * sin_rotation) + (half_height * cos_rotation))
 
-        self.verts[:] = []
-        self.verts.append(top_left)
-        self.verts.append(top_right)
-        self.verts.append(bottom_left)
-        self.verts.append(bottom_right)
-
-        self.edges[:] = []
-        self.edges.append([top_left, top_right])
-        self.edges.append([top_left, bottom_left])
-        self.edges.append([bottom_right, top_right])
-        self.edges.append([bottom_right, bottom_left])
+        # opposite edges face the same way so a rectangle only has two axes, and as they only change when the bat
+        # moves or rotates they are worked out here rather than in every collision test
+        self.axes[0][0] = cos_rotation
+        self.axes[0][1] = sin_rotation
+        self.axes[1][0] = -sin_rotation
+        self.axes[1][1] = cos_rotation
+        self.update_bounding_box()
+
+    @property
+    def edges(self):
+        # only the separating axis test needs these, so they are made from the verts when it asks for them
+        top_left, top_right, bottom_left, bottom_right = self.verts
+        return [[top_left, top_right], [top_left, bottom_left],
+                [bottom_right, top_right], [bottom_right, bottom_left]]
+
+    def update_bounding_box(self):
+        xs = [vert[0] for vert in self.verts]
+        ys = [vert[1] for vert in self.verts]
+        self.bounds = (min(xs), min(ys), max(xs), max(ys))
+
+    def bounds_overlap(self, rect):
+        """
+        A quick check of a rect against the box around the bat's rotated corners. If this fails there's no need
+        for the full polygon test.
+        """
+        left, top, right, bottom = self.bounds
+        return not (rect.right < left or rect.left > right or rect.bottom < top or rect.top > bottom)
 
     @staticmethod
     def collide_polygon_with_polygon(a, b):
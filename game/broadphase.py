@@ -0,0 +1,76 @@
+"""
+Cheap tests that rule colliders out before a ball does any real collision work against them.
+
+Walls never move, so they are sorted into a grid of cells once when a level is built and each ball then only looks
+at the walls in the cells it covers. (Bats, which do move, keep an axis aligned box around their rotated corners
+instead - see Bat.bounds_overlap.)
+
+Sleeping balls don't move either, so they get filed into a grid of their own while they sleep. That lets a moving bat
+find the sleepers it might disturb without looking at every ball.
+"""
+
+WALL_CELL_SIZE = 64
+
+
+class WallIndex:
+    def __init__(self, walls, cell_size=WALL_CELL_SIZE):
+        self.walls = list(walls)
+        self.cell_size = cell_size
+        self.cells = {}
+        for index, wall in enumerate(self.walls):
+            for cell in cells_covering(wall.rect.left, wall.rect.top, wall.rect.right, wall.rect.bottom, cell_size):
+                self.cells.setdefault(cell, []).append(index)
+
+    def query(self, rect):
+        """
+        Returns the walls that could be touching this rect, in the same order as the walls were given in, so
+        balls still resolve their bounces in the order they always have.
+        """
+        found = set()
+        for cell in cells_covering(rect.left, rect.top, rect.right, rect.bottom, self.cell_size):
+            indices = self.cells.get(cell)
+            if indices is not None:
+                found.update(indices)
+        return [self.walls[index] for index in sorted(found)]
+
+
+class SleeperIndex:
+    def __init__(self, cell_size=WALL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def add(self, ball):
+        rect = ball.rect
+        for cell in cells_covering(rect.left, rect.top, rect.right, rect.bottom, self.cell_size):
+            self.cells.setdefault(cell, set()).add(ball)
+
+    def remove(self, ball):
+        rect = ball.rect
+        for cell in cells_covering(rect.left, rect.top, rect.right, rect.bottom, self.cell_size):
+            sleepers = self.cells.get(cell)
+            if sleepers is not None:
+                sleepers.discard(ball)
+                if not sleepers:
+                    del self.cells[cell]
+
+    def clear(self):
+        self.cells.clear()
+
+    def overlapping(self, left, top, right, bottom):
+        """
+        The sleeping balls whose rects overlap the box from (left, top) to (right, bottom).
+        """
+        found = set()
+        for cell in cells_covering(left, top, right, bottom, self.cell_size):
+            sleepers = self.cells.get(cell)
+            if sleepers is not None:
+                found.update(sleepers)
+        return [ball for ball in found if not (ball.rect.right < left or ball.rect.left > right or
+                                               ball.rect.bottom < top or ball.rect.top > bottom)]
+
+
+def cells_covering(left, top, right, bottom, size):
+    for x in range(int(left // size), int(right // size) + 1):
+        for y in range(int(top // size), int(bottom // size) + 1):
+            yield x, y
+
@@ -0,0 +1,138 @@
+import math
+
+from game.circle import circle_against_box
+
+"""
+Swept (continuous) collision tests for a ball moving in a straight line over one step.
+
+Rather than only asking 'is the ball overlapping anything now?', these work out how far along its move a ball first
+touches a wall or a bat, so that a fast ball - or a big time step - can't carry it straight through something thin.
+Every test grows the collider by the shape of the ball and then traces the ball's centre through it as a ray, giving
+back the fraction of the move at which it enters, or None if it doesn't.
+
+A box ball grows a bat into the octagon it sweeps out, which is the box between the slabs along the bat's two axes
+and along x and y - the same four axes the separating axis test uses, so the sweep and the overlap test always agree
+on where the bat is. A round ball grows a wall or bat into a box with rounded corners, which is the box grown by the
+radius sideways, the box grown by the radius up and down, and a circle of the radius on each corner.
+
+A ball that starts off already touching something - sitting a fraction of a pixel into it, which the overlap test
+can miss after rounding - enters it straight away (0.0) if it is heading deeper in and not at all (None) if it is on
+its way back out. Either way it goes by the same overlap test respond() uses, so the sweep never stops a ball short
+for a contact that respond() won't then find.
+"""
+
+
+def sweep_box_against_rect(centre, half_size, move, rect):
+    lows = (rect.left - half_size[0], rect.top - half_size[1])
+    highs = (rect.right + half_size[0], rect.bottom + half_size[1])
+    return ray_against_slabs(centre, move, lows, highs)
+
+
+def sweep_box_against_bat(centre, half_size, move, bat):
+    offset = (centre[0] - bat.position[0], centre[1] - bat.position[1])
+    bat_half_sizes = (bat.width / 2, bat.height / 2)
+    local_centre = []
+    local_move = []
+    lows = []
+    highs = []
+    for axis in (bat.axes[0], bat.axes[1], (1.0, 0.0), (0.0, 1.0)):
+        local_centre.append(offset[0] * axis[0] + offset[1] * axis[1])
+        local_move.append(move[0] * axis[0] + move[1] * axis[1])
+        # how far the bat and the ball's box each reach along this axis from their centres
+        bat_reach = sum(bat_half_size * abs(bat_axis[0] * axis[0] + bat_axis[1] * axis[1])
+                        for bat_axis, bat_half_size in zip(bat.axes, bat_half_sizes))
+        reach = bat_reach + half_size[0] * abs(axis[0]) + half_size[1] * abs(axis[1])
+        lows.append(-reach)
+        highs.append(reach)
+    return ray_against_slabs(local_centre, local_move, lows, highs)
+
+
+def sweep_circle_against_rect(centre, radius, move, rect):
+    return sweep_circle_against_box(centre, radius, move, rect.left, rect.top, rect.right, rect.bottom)
+
+
+def sweep_circle_against_bat(centre, radius, move, bat):
+    # in the bat's own frame, where it is an axis aligned box centred on the origin
+    along, across = bat.axes
+    offset = (centre[0] - bat.position[0], centre[1] - bat.position[1])
+    local_centre = (offset[0] * along[0] + offset[1] * along[1], offset[0] * across[0] + offset[1] * across[1])
+    local_move = (move[0] * along[0] + move[1] * along[1], move[0] * across[0] + move[1] * across[1])
+    half_width = bat.width / 2
+    half_height = bat.height / 2
+    return sweep_circle_against_box(local_centre, radius, local_move, -half_width, -half_height, half_width,
+                                    half_height)
+
+
+def sweep_circle_against_box(centre, radius, move, left, top, right, bottom):
+    contact = circle_against_box(centre[0], centre[1], radius, left, top, right, bottom)
+    if contact is not None:
+        _, normal_x, normal_y = contact
+        return 0.0 if move[0] * normal_x + move[1] * normal_y < 0.0 else None
+
+    earliest = None
+    entries = [ray_against_slabs(centre, move, (left - radius, top), (right + radius, bottom)),
+               ray_against_slabs(centre, move, (left, top - radius), (right, bottom + radius))]
+    entries += [ray_against_circle(centre, move, corner, radius)
+                for corner in ((left, top), (right, top), (left, bottom), (right, bottom))]
+    for entry in entries:
+        if entry is not None and (earliest is None or entry < earliest):
+            earliest = entry
+    return earliest
+
+
+def ray_against_circle(origin, move, centre, radius):
+    # where |origin + t * move - centre| = radius, for a ray that starts outside the circle
+    offset_x = origin[0] - centre[0]
+    offset_y = origin[1] - centre[1]
+    a = move[0] * move[0] + move[1] * move[1]
+    b = offset_x * move[0] + offset_y * move[1]
+    c = offset_x * offset_x + offset_y * offset_y - radius * radius
+    if a == 0.0 or b >= 0.0:
+        return None
+    discriminant = b * b - a * c
+    if discriminant < 0.0:
+        return None
+    enter = (-b - math.sqrt(discriminant)) / a
+    return enter if 0.0 <= enter <= 1.0 else None
+
+
+def ray_against_slabs(origin, move, lows, highs):
+    """
+    The time (as a fraction of move) that a ray from origin enters the region between lows and highs on every axis,
+    or None if it misses or only gets there after the move is over. A ray that starts off inside already enters it
+    straight away (0.0) if it is heading deeper in across the side it is nearest to, and None if it is on its way
+    back out.
+    """
+    enter = 0.0
+    exit = 1.0
+    started_inside = True
+    for start, distance, low, high in zip(origin, move, lows, highs):
+        if start < low or start > high:
+            started_inside = False
+        if distance == 0.0:
+            if start < low or start > high:
+                return None
+            continue
+
+        near = (low - start) / distance
+        far = (high - start) / distance
+        if near > far:
+            near, far = far, near
+        enter = max(enter, near)
+        exit = min(exit, far)
+        if enter > exit:
+            return None
+
+    if started_inside:
+        return 0.0 if heading_deeper(origin, move, lows, highs) else None
+    return enter
+
+
+def heading_deeper(origin, move, lows, highs):
+    # the side the point is nearest to is the one it came in through, so that's the one it mustn't go further past
+    nearest = None
+    for start, distance, low, high in zip(origin, move, lows, highs):
+        for depth, inward in ((start - low, distance), (high - start, -distance)):
+            if nearest is None or depth < nearest[0]:
+                nearest = (depth, inward)
+    return nearest[1] > 0.0
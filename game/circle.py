@@ -0,0 +1,123 @@
+import math
+
+import numpy as np
+
+"""
+Contact tests for round balls against walls and bats.
+
+A ball treated as a circle only needs its centre and radius. Against an axis aligned box (a wall) the nearest point of
+the box to the centre is the centre clamped to the box, and the ball is touching if that point is closer than its
+radius; the direction from that point to the centre is the contact normal, and how much closer it is than the radius
+is the depth. A bat is the same test done in the bat's own frame, where it is an axis aligned box centred on the
+origin, with the normal turned back into world space afterwards. Near a bat's corner that normal points out of the
+corner rather than straight up from its face, which is what a ball clipping the end of a bat should bounce off.
+
+Every test gives back (depth, normal x, normal y), the normal pointing from the wall or bat towards the ball, or None
+if they aren't touching. Like Rect.colliderect, only touching at a single point doesn't count.
+
+collide_circles_with_bats does the bat test for a whole array of balls at once, in the same steps as the one ball
+version so the two always agree.
+"""
+
+# the outward normals of a box's left, right, top and bottom sides
+SIDE_NORMALS = ((-1.0, 0.0), (1.0, 0.0), (0.0, -1.0), (0.0, 1.0))
+
+
+def circle_against_box(centre_x, centre_y, radius, left, top, right, bottom):
+    nearest_x = min(max(centre_x, left), right)
+    nearest_y = min(max(centre_y, top), bottom)
+    offset_x = centre_x - nearest_x
+    offset_y = centre_y - nearest_y
+    distance_squared = offset_x * offset_x + offset_y * offset_y
+    if distance_squared >= radius * radius:
+        return None
+    if distance_squared > 0.0:
+        distance = math.sqrt(distance_squared)
+        return radius - distance, offset_x / distance, offset_y / distance
+
+    # the centre is inside the box, so push it out through whichever side is nearest
+    gaps = (centre_x - left, right - centre_x, centre_y - top, bottom - centre_y)
+    side = gaps.index(min(gaps))
+    return radius + gaps[side], SIDE_NORMALS[side][0], SIDE_NORMALS[side][1]
+
+
+def circle_against_rect(centre_x, centre_y, radius, rect):
+    return circle_against_box(centre_x, centre_y, radius, rect.left, rect.top, rect.right, rect.bottom)
+
+
+def circle_against_bat(centre_x, centre_y, radius, bat):
+    along, across = bat.axes
+    offset_x = centre_x - bat.position[0]
+    offset_y = centre_y - bat.position[1]
+    local_x = offset_x * along[0] + offset_y * along[1]
+    local_y = offset_x * across[0] + offset_y * across[1]
+    half_width = bat.width / 2
+    half_height = bat.height / 2
+    contact = circle_against_box(local_x, local_y, radius, -half_width, -half_height, half_width, half_height)
+    if contact is None:
+        return None
+    depth, normal_x, normal_y = contact
+    return depth, normal_x * along[0] + normal_y * across[0], normal_x * along[1] + normal_y * across[1]
+
+
+def collide_circles_with_bats(centres, radii, bats):
+    """
+    circle_against_bat for every ball against every bat. centres is an (n, 2) array and radii has one radius per
+    ball. Returns a list of (hits, depths, normals), one per bat, like collide_boxes_with_bats. Only the balls within
+    reach of a bat (see Ball.circle_contact_normal) go through the full test.
+    """
+    contacts = []
+    for bat in bats:
+        offsets = np.abs(centres - bat.position)
+        reach = (bat.width + bat.height) / 2 + radii
+        near = np.flatnonzero((offsets[:, 0] < reach) & (offsets[:, 1] < reach))
+
+        hits = np.zeros(len(centres), dtype=bool)
+        depths = np.zeros(len(centres))
+        normals = np.zeros((len(centres), 2))
+        if len(near) > 0:
+            hits[near], depths[near], normals[near] = collide_circles_with_bat(centres[near], radii[near], bat)
+        contacts.append((hits, depths, normals))
+    return contacts
+
+
+def collide_circles_with_bat(centres, radii, bat):
+    along, across = bat.axes
+    offset_x = centres[:, 0] - bat.position[0]
+    offset_y = centres[:, 1] - bat.position[1]
+    local = np.empty((len(centres), 2))
+    local[:, 0] = offset_x * along[0] + offset_y * along[1]
+    local[:, 1] = offset_x * across[0] + offset_y * across[1]
+    half_size = np.array([bat.width / 2, bat.height / 2])
+
+    offsets = local - np.clip(local, -half_size, half_size)
+    distance_squared = offsets[:, 0] * offsets[:, 0] + offsets[:, 1] * offsets[:, 1]
+    hits = distance_squared < radii * radii
+
+    distances = np.sqrt(distance_squared)
+    outside = distance_squared > 0.0
+    depths = radii - distances
+    local_normals = np.zeros((len(centres), 2))
+    local_normals[outside] = offsets[outside] / distances[outside, None]
+
+    inside = np.flatnonzero(~outside)
+    if len(inside):
+        # left, right, top and bottom, in the same order as circle_against_box looks at them
+        gaps = np.stack((local[inside, 0] + half_size[0], half_size[0] - local[inside, 0],
+                         local[inside, 1] + half_size[1], half_size[1] - local[inside, 1]), axis=1)
+        sides = np.argmin(gaps, axis=1)
+        depths[inside] = radii[inside] + gaps[np.arange(len(inside)), sides]
+        local_normals[inside] = np.array(SIDE_NORMALS).take(sides, axis=0)
+
+    normals = np.empty_like(local_normals)
+    normals[:, 0] = local_normals[:, 0] * along[0] + local_normals[:, 1] * across[0]
+    normals[:, 1] = local_normals[:, 0] * along[1] + local_normals[:, 1] * across[1]
+    return hits, depths, normals
+
+
+def ball_circles(balls):
+    # a ball's position is the top left of its box, so its centre is a radius in from there
+    radii = np.array([ball.radius for ball in balls], dtype=np.float64)
+    centres = np.array([ball.position for ball in balls], dtype=np.float64).reshape(-1, 2)
+    centres += radii[:, None]
+    return centres, radii
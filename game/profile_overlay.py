@@ -0,0 +1,25 @@
+import pygame
+
+
+class ProfileOverlay:
+    """
+    Draws the last frame's phase timings and counters from a PhaseTimer as a column of text.
+    """
+    def __init__(self, timer, position, colour):
+        self.timer = timer
+        self.position = position
+        self.colour = pygame.Color(colour)
+        self.font = pygame.font.Font(None, 20)
+
+    def render(self, screen):
+        lines = ['{}: {:.2f}ms'.format(name, seconds * 1000.0)
+                 for name, seconds in sorted(self.timer.last_frame.items())]
+        lines += ['{}: {}'.format(name, count) for name, count in sorted(self.timer.last_frame_counts.items())]
+
+        x, y = self.position
+        drawn = []
+        for line in lines:
+            text = self.font.render(line, True, self.colour)
+            drawn.append(screen.blit(text, text.get_rect(x=x, y=y)))
+            y += text.get_height()
+        return drawn
@@ -0,0 +1,110 @@
+"""
+A plain Python stand-in for pygame.Rect, so the physics can run without importing pygame.
+
+Only the parts of pygame.Rect the simulation uses are here, and they behave the same way down to the rounding:
+pygame keeps whole number coordinates, truncating the numbers a rect is made or moved with but rounding (halves away
+from zero) the ones assigned to its attributes, and the bounce physics has always depended on exactly that. It is a
+four item sequence too, so it can be passed to pygame's drawing and blitting functions wherever a pygame.Rect could.
+"""
+
+
+def round_half_away(value):
+    if value >= 0:
+        return int(value + 0.5)
+    return -int(0.5 - value)
+
+
+class Rect:
+    # the edges are what collision tests read, over and over, so they are what's stored
+    __slots__ = ('left', 'top', 'right', 'bottom')
+
+    def __init__(self, *args):
+        # Rect(x, y, width, height) or Rect((x, y), (width, height)), like pygame
+        if len(args) == 2:
+            (x, y), (w, h) = args
+        else:
+            x, y, w, h = args
+        self.left = int(x)
+        self.top = int(y)
+        self.right = self.left + int(w)
+        self.bottom = self.top + int(h)
+
+    def __repr__(self):
+        return '<rect({}, {}, {}, {})>'.format(*self)
+
+    def __len__(self):
+        return 4
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __iter__(self):
+        return iter((self.left, self.top, self.right - self.left, self.bottom - self.top))
+
+    def __eq__(self, other):
+        return tuple(self) == tuple(other)
+
+    @property
+    def x(self):
+        return self.left
+
+    @x.setter
+    def x(self, value):
+        value = round_half_away(value)
+        self.right += value - self.left
+        self.left = value
+
+    @property
+    def y(self):
+        return self.top
+
+    @y.setter
+    def y(self, value):
+        value = round_half_away(value)
+        self.bottom += value - self.top
+        self.top = value
+
+    @property
+    def width(self):
+        return self.right - self.left
+
+    @property
+    def height(self):
+        return self.bottom - self.top
+
+    w = width
+    h = height
+
+    @property
+    def size(self):
+        return self.right - self.left, self.bottom - self.top
+
+    @property
+    def centerx(self):
+        return self.left + (self.right - self.left) // 2
+
+    @centerx.setter
+    def centerx(self, value):
+        self.x = round_half_away(value) - (self.right - self.left) // 2
+
+    @property
+    def centery(self):
+        return self.top + (self.bottom - self.top) // 2
+
+    @centery.setter
+    def centery(self, value):
+        self.y = round_half_away(value) - (self.bottom - self.top) // 2
+
+    def move(self, x, y):
+        return Rect(self.left + int(x), self.top + int(y), self.right - self.left, self.bottom - self.top)
+
+    def union(self, other):
+        left = min(self.left, other.left)
+        top = min(self.top, other.top)
+        return Rect(left, top, max(self.right, other.right) - left, max(self.bottom, other.bottom) - top)
+
+    def colliderect(self, other):
+        # rects with no area never collide, and ones that only share an edge don't either
+        return (self.left < self.right and self.top < self.bottom and other.left < other.right and
+                other.top < other.bottom and self.left < other.right and other.left < self.right and
+                self.top < other.bottom and other.top < self.bottom)
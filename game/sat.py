@@ -0,0 +1,76 @@
+import numpy as np
+
+"""
+A batched version of the separating axis test in Bat.collide_polygon_with_polygon.
+
+Balls are axis aligned boxes, so rather than looping over every ball's vertices and edges in Python, all of the balls
+are handed over at once as an array of (left, top, right, bottom) rows and tested against a polygon's vertices in a
+few array operations. A box projects onto any axis as its centre's projection plus or minus a radius, which saves
+projecting its corners one at a time.
+
+As well as whether each ball hits, the test gives back how far it has sunk in (the smallest overlap across all the
+axes) and the direction to push it back out along, pointing from the polygon towards the ball.
+"""
+
+BOX_AXES = np.array([[1.0, 0.0], [0.0, 1.0]])
+
+
+def collide_boxes_with_polygon(boxes, polygon_verts, polygon_axes):
+    """
+    Tests every box against one convex polygon. polygon_axes are the unit normals of the polygon's edges, which
+    for a bat are worked out once whenever it moves or rotates rather than here.
+
+    Returns a hit mask, penetration depths and contact normals, one for each box.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    axes = np.concatenate((BOX_AXES, np.asarray(polygon_axes, dtype=np.float64)))
+
+    centres = (boxes[:, :2] + boxes[:, 2:]) * 0.5
+    half_sizes = (boxes[:, 2:] - boxes[:, :2]) * 0.5
+    box_centres = centres @ axes.T
+    box_radii = half_sizes @ np.abs(axes).T
+
+    polygon_projections = np.asarray(polygon_verts, dtype=np.float64) @ axes.T
+    polygon_min = polygon_projections.min(axis=0)
+    polygon_max = polygon_projections.max(axis=0)
+
+    # how far the box would have to move along each axis, one way or the other, to stop overlapping
+    push_forward = polygon_max - (box_centres - box_radii)
+    push_back = (box_centres + box_radii) - polygon_min
+    hits = np.all((push_forward >= 0.0) & (push_back >= 0.0), axis=1)
+
+    overlap = np.minimum(push_forward, push_back)
+    best_axis = np.argmin(overlap, axis=1)
+    rows = np.arange(len(boxes))
+    depths = overlap[rows, best_axis]
+    normals = axes[best_axis]
+    normals[push_back[rows, best_axis] < push_forward[rows, best_axis]] *= -1.0
+    return hits, depths, normals
+
+
+def collide_boxes_with_bats(boxes, bats):
+    """
+    Runs collide_boxes_with_polygon for every bat, returning a list of (hits, depths, normals), one per bat. Only
+    the boxes that overlap a bat's bounding box go through the full test.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    contacts = []
+    for bat in bats:
+        left, top, right, bottom = bat.bounds
+        near = np.flatnonzero((boxes[:, 2] >= left) & (boxes[:, 0] <= right) &
+                              (boxes[:, 3] >= top) & (boxes[:, 1] <= bottom))
+
+        hits = np.zeros(len(boxes), dtype=bool)
+        depths = np.zeros(len(boxes))
+        normals = np.zeros((len(boxes), 2))
+        if len(near) > 0:
+            hits[near], depths[near], normals[near] = collide_boxes_with_polygon(boxes[near], bat.verts, bat.axes)
+        contacts.append((hits, depths, normals))
+    return contacts
+
+
+def ball_boxes(balls):
+    boxes = np.empty((len(balls), 4))
+    for i, ball in enumerate(balls):
+        boxes[i] = (ball.rect.left, ball.rect.top, ball.rect.right, ball.rect.bottom)
+    return boxes
@@ -0,0 +1,192 @@
+import array
+import struct
+
+import numpy as np
+
+from ball import Ball
+from game.rect import Rect
+
+"""
+Snapshots of a BounceWorld's state, for rolling back and re-simulating.
+
+Everything a step reads or changes - each ball's position, velocity, bounce count and what it is currently touching,
+each bat's position, rotation and controls, and the state of the world's random number generator - is copied into a
+few flat numpy arrays rather than pickling the objects, so a snapshot is small, quick to take and quick to put back.
+Things that can be worked out again from that state (rects, verts, axes and bounds) are rebuilt on restore instead
+of being stored.
+
+What a ball is touching is kept as one bit per wall and bat, in the order world.walls + world.bats.
+
+SnapshotRing keeps the snapshots for the last few frames so that when a late input turns up the world can be rolled
+back to the frame it belongs to and stepped forward again.
+"""
+
+# x, y, velocity x, velocity y, previous x, previous y, start x, start y, bounces, asleep, still steps, radius
+BALL_FIELDS = 12
+# x, y, rotation, previous x, previous y, previous rotation, normal x, normal y, and the four control flags
+BAT_FIELDS = 12
+
+HEADER = struct.Struct('<4I')
+
+
+class WorldSnapshot:
+    __slots__ = ('balls', 'colours', 'contacts', 'bats', 'thing_count', 'random_state', 'gauss_next')
+
+    def __init__(self, balls, colours, contacts, bats, thing_count, random_state, gauss_next):
+        self.balls = balls
+        self.colours = colours
+        self.contacts = contacts
+        self.bats = bats
+        self.thing_count = thing_count
+        self.random_state = random_state
+        self.gauss_next = gauss_next
+
+    @property
+    def nbytes(self):
+        return (self.balls.nbytes + self.colours.nbytes + self.contacts.nbytes + self.bats.nbytes +
+                self.random_state.nbytes)
+
+    def to_bytes(self):
+        header = HEADER.pack(len(self.balls), len(self.bats), self.thing_count, self.contacts.shape[1])
+        gauss_next = struct.pack('<d', float('nan') if self.gauss_next is None else self.gauss_next)
+        return b''.join((header, gauss_next, self.balls.tobytes(), self.colours.tobytes(), self.contacts.tobytes(),
+                         self.bats.tobytes(), self.random_state.tobytes()))
+
+    @classmethod
+    def from_bytes(cls, data):
+        ball_count, bat_count, thing_count, contact_bytes = HEADER.unpack_from(data)
+        offset = HEADER.size
+        gauss_next = struct.unpack_from('<d', data, offset)[0]
+        offset += 8
+
+        arrays = []
+        for dtype, shape in ((np.float64, (ball_count, BALL_FIELDS)), (np.uint8, (ball_count, 4)),
+                             (np.uint8, (ball_count, contact_bytes)), (np.float64, (bat_count, BAT_FIELDS)),
+                             (np.uint32, (625,))):
+            count = int(np.prod(shape))
+            arrays.append(np.frombuffer(data, dtype, count, offset).reshape(shape).copy())
+            offset += count * np.dtype(dtype).itemsize
+
+        balls, colours, contacts, bats, random_state = arrays
+        return cls(balls, colours, contacts, bats, thing_count, random_state,
+                   None if gauss_next != gauss_next else gauss_next)
+
+
+def take_snapshot(world):
+    things = world.walls + world.bats
+    thing_index = {id(thing): index for index, thing in enumerate(things)}
+
+    values = []
+    touching = []
+    for ball_index, ball in enumerate(world.balls):
+        values += ball.position
+        values += ball.velocity
+        values += ball.previous_position
+        values += ball.start_position
+        values += (ball.number_of_bounces, ball.asleep, ball.still_steps, ball.radius)
+        if ball.collided_with_things:
+            touching += [(ball_index, thing_index[id(thing)]) for thing in ball.collided_with_things]
+    balls = np.array(values, dtype=np.float64).reshape(-1, BALL_FIELDS)
+    colours = np.array([tuple(ball.ball_colour) for ball in world.balls], dtype=np.uint8).reshape(-1, 4)
+
+    contacts = np.zeros((len(world.balls), len(things)), dtype=bool)
+    if touching:
+        contacts[tuple(np.array(touching).T)] = True
+
+    values = []
+    for bat in world.bats:
+        values += bat.position
+        values.append(bat.rotation)
+        values += bat.previous_position
+        values.append(bat.previous_rotation)
+        values += bat.normal_vec
+        values += (bat.move_left, bat.move_right, bat.rotate_left, bat.rotate_right)
+    bats = np.array(values, dtype=np.float64).reshape(-1, BAT_FIELDS)
+
+    _, random_state, gauss_next = world.rng.getstate()
+    return WorldSnapshot(balls, colours, np.packbits(contacts, axis=1), bats, len(things),
+                         np.frombuffer(array.array('I', random_state), np.uint32), gauss_next)
+
+
+def restore_snapshot(world, snapshot):
+    if len(snapshot.bats) != len(world.bats) or snapshot.thing_count != len(world.walls) + len(world.bats):
+        raise ValueError('snapshot was taken of a world with different walls or bats')
+
+    # balls added since the snapshot are dropped, and ones that have gone are made again
+    ball_count = len(snapshot.balls)
+    del world.balls[ball_count:]
+    for colour, row in zip(snapshot.colours[len(world.balls):].tolist(), snapshot.balls[len(world.balls):].tolist()):
+        world.balls.append(Ball((row[6], row[7]), tuple(colour), world.rng, row[11]))
+
+    things = world.walls + world.bats
+    touching = {}
+    for ball_index, thing_index in zip(*np.nonzero(np.unpackbits(snapshot.contacts, axis=1,
+                                                                 count=snapshot.thing_count))):
+        touching.setdefault(int(ball_index), set()).add(things[thing_index])
+
+    for ball_index, (ball, row) in enumerate(zip(world.balls, snapshot.balls.tolist())):
+        ball.position[0], ball.position[1] = row[0], row[1]
+        ball.velocity[0], ball.velocity[1] = row[2], row[3]
+        ball.previous_position[0], ball.previous_position[1] = row[4], row[5]
+        ball.start_position[0], ball.start_position[1] = row[6], row[7]
+        ball.number_of_bounces = int(row[8])
+        ball.asleep = bool(row[9])
+        ball.still_steps = int(row[10])
+        ball.collided_with_things = touching.get(ball_index, set())
+        if ball.radius != row[11]:
+            ball.radius = row[11]
+            ball.rect = Rect((0, 0), (2 * ball.radius, 2 * ball.radius))
+        ball.rect.x = ball.position[0]
+        ball.rect.y = ball.position[1]
+        ball.update_verts()
+
+    for bat, row in zip(world.bats, snapshot.bats.tolist()):
+        bat.position[0], bat.position[1], bat.rotation = row[0], row[1], row[2]
+        bat.previous_position[0], bat.previous_position[1], bat.previous_rotation = row[3], row[4], row[5]
+        bat.normal_vec[0], bat.normal_vec[1] = row[6], row[7]
+        bat.move_left, bat.move_right, bat.rotate_left, bat.rotate_right = (bool(flag) for flag in row[8:12])
+        bat.rect.centerx = bat.position[0]
+        bat.rect.centery = bat.position[1]
+        bat.update_real_bounds()
+
+    world.refile_sleepers()
+
+    # last of all, as making balls above draws random numbers
+    world.rng.setstate((3, tuple(snapshot.random_state.tolist()), snapshot.gauss_next))
+
+
+class SnapshotRing:
+    """
+    The snapshots of the last capacity frames, for rolling back to any one of them.
+    """
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self.snapshots = [None] * capacity
+        self.frames = [-1] * capacity
+        self.latest = -1
+
+    def save(self, frame, world):
+        slot = frame % self.capacity
+        self.snapshots[slot] = take_snapshot(world)
+        self.frames[slot] = frame
+        self.latest = frame
+
+    def __contains__(self, frame):
+        return self.frames[frame % self.capacity] == frame
+
+    def get(self, frame):
+        if frame not in self:
+            raise KeyError('no snapshot kept for frame {}'.format(frame))
+        return self.snapshots[frame % self.capacity]
+
+    def rollback(self, world, frame):
+        """
+        Puts the world back how it was at the start of frame and forgets every snapshot after it, which will be
+        taken again as the frames are re-simulated.
+        """
+        restore_snapshot(world, self.get(frame))
+        for later in range(frame + 1, self.latest + 1):
+            slot = later % self.capacity
+            if self.frames[slot] == later:
+                self.frames[slot] = -1
+        self.latest = frame
@@ -0,0 +1,70 @@
+import math
+from collections import OrderedDict
+
+"""
+A cache of rotated copies of a sprite.
+
+pygame.transform.rotate makes a brand new surface every time it is called, which is slow and churns memory when a
+bat spins for several frames in a row - let alone dozens of them. Instead, angles are rounded to one of a fixed number
+of buckets (a degree apart by default, which is less than a pixel out at the ends of a bat) and each rotated copy is
+made once and kept. Sprites are looked up by a key describing what they look like rather than by the object drawing
+them, so every bat of the same size and colour shares the same copies. The cache only holds so many sprites and
+throws away the least recently used one when it fills up.
+"""
+
+ANGLE_BUCKETS = 360
+MAX_SPRITES = 2048
+
+
+class RotatedSpriteCache:
+    def __init__(self, buckets=ANGLE_BUCKETS, max_sprites=MAX_SPRITES):
+        self.buckets = buckets
+        self.max_sprites = max_sprites
+        self.sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def bucket(self, radians):
+        return round(math.degrees(radians) * self.buckets / 360.0) % self.buckets
+
+    def get(self, surface, key, radians):
+        """
+        The surface rotated anticlockwise by radians, to the nearest bucket. key must be the same for any two
+        surfaces that look the same, and different otherwise.
+        """
+        cache_key = (key, self.bucket(radians))
+        sprite = self.sprites.get(cache_key)
+        if sprite is not None:
+            self.hits += 1
+            self.sprites.move_to_end(cache_key)
+            return sprite
+
+        self.misses += 1
+        return self.add(surface, cache_key)
+
+    def add(self, surface, cache_key):
+        import pygame
+        sprite = pygame.transform.rotate(surface, cache_key[1] * 360.0 / self.buckets)
+        self.sprites[cache_key] = sprite
+        if len(self.sprites) > self.max_sprites:
+            self.sprites.popitem(last=False)
+        return sprite
+
+    def prewarm(self, surface, key):
+        """
+        Makes every rotation of a sprite up front so that nothing has to be rotated mid game.
+        """
+        for bucket in range(self.buckets):
+            if (key, bucket) not in self.sprites:
+                self.add(surface, (key, bucket))
+
+    def clear(self):
+        self.sprites.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+BAT_SPRITES = RotatedSpriteCache()
@@ -1,10 +1,10 @@
-import pygame
+from game.rect import Rect
 
 
 class Wall:
     def __init__(self, top_left, bottom_right):
-        self.rect = pygame.Rect(top_left, (bottom_right[0]-top_left[0], bottom_right[1]-top_left[1]))
-        self.wall_colour = pygame.Color(200, 200, 200, 200)
+        self.rect = Rect(top_left, (bottom_right[0]-top_left[0], bottom_right[1]-top_left[1]))
+        self.wall_colour = (200, 200, 200, 200)
 
         self.bounce_factor = 1.01
 
@@ -16,4 +16,5 @@ class Wall:
             self.is_vert = True
 
     def render(self, screen):
+        import pygame
         pygame.draw.rect(screen, self.wall_colour, self.rect)
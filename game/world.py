@@ -0,0 +1,194 @@
+import random
+
+import numpy as np
+
+from game.wall import Wall
+from game.bat import Bat, ControlScheme
+from game.sat import collide_boxes_with_bats, ball_boxes
+from game.circle import collide_circles_with_bats, ball_circles
+from game.broadphase import WallIndex, SleeperIndex
+from game.snapshot import take_snapshot, restore_snapshot
+
+from ball import Ball
+from sim.profiling import NULL_TIMER
+
+# below this many balls the numpy set up costs more than testing the balls one at a time
+BATCHED_COLLISION_MIN = 24
+
+# a ball that hasn't moved at all for this many steps is put to sleep
+SLEEP_STEPS = 10
+
+
+class BounceWorld:
+    """
+    Everything that makes up one game of bounce physics - the walls, bats and balls plus gravity - with the
+    per-frame update pulled out of the main loop so it can be stepped with or without a window.
+
+    Everything random that happens to the world (new balls' start directions, resets) is drawn from its own
+    random.Random, seeded with seed, so two worlds made with the same seed and stepped the same way stay identical.
+    """
+    def __init__(self, walls, bats, balls, gravity=(0.0, 400.0), continuous_collision=False, sleeping=True,
+                 seed=None, round_balls=True):
+        self.walls = walls
+        # walls never move, so the grid of which walls are where only has to be built the once
+        self.wall_index = WallIndex(walls)
+        self.bats = bats
+        self.balls = balls
+        self.gravity = [float(gravity[0]), float(gravity[1])]
+        # sweep balls along their moves so they can't pass through things at large time steps
+        self.continuous_collision = continuous_collision
+        # balls collide as circles, bouncing off the normal where they touch, rather than as boxes (see Ball.respond)
+        self.round_balls = round_balls
+        # a ball resting on something with no velocity stays exactly as it is step after step until a bat moves
+        # into it, so sleeping balls can be skipped without changing what happens
+        self.sleeping = sleeping
+        self.sleepers = SleeperIndex()
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.timer = NULL_TIMER
+
+    @classmethod
+    def default(cls, **kwargs):
+        # the same layout that bounce_physics.py has always started with
+        walls = [Wall((10, 10), (790, 20)), Wall((10, 580), (790, 590)),
+                 Wall((10, 10), (20, 590)), Wall((780, 10), (790, 590))]
+
+        bats = [Bat((400, 500), ControlScheme())]
+
+        world = cls(walls, bats, [], **kwargs)
+        world.balls.append(Ball((400, 300), (255, 255, 255, 255), world.rng))
+        return world
+
+    def total_bounces(self):
+        total_ball_bounces = 0
+        for ball in self.balls:
+            total_ball_bounces += ball.number_of_bounces
+        return total_ball_bounces
+
+    def step(self, dt):
+        with self.timer.phase('integration'):
+            for bat in self.bats:
+                bounds = bat.bounds
+                bat.update(dt)
+                if self.sleepers.cells and (bat.position != bat.previous_position or
+                                            bat.rotation != bat.previous_rotation):
+                    self.wake_near(bounds, bat.bounds)
+
+        balls = self.balls
+        if self.sleepers.cells:
+            balls = [ball for ball in balls if not ball.asleep]
+
+        with self.timer.phase('broad_phase'):
+            nearby_walls = [self.wall_index.query(ball.rect) for ball in balls]
+
+        if self.timer.enabled:
+            bounces_before = self.total_bounces()
+            self.timer.count('wall_candidates', sum(len(walls) for walls in nearby_walls))
+
+        # test every ball against every bat in one go before any of them move
+        with self.timer.phase('narrow_phase'):
+            bat_hits = [None] * len(balls)
+            if self.bats and len(balls) >= BATCHED_COLLISION_MIN:
+                if self.round_balls:
+                    contacts = collide_circles_with_bats(*ball_circles(balls), self.bats)
+                    # a round ball's hit is the normal where it touches, or None where it doesn't - and as most balls
+                    # aren't touching any bat, they all share one row of misses and only the rest get their own
+                    bat_hits = [(None,) * len(self.bats)] * len(balls)
+                    touching = np.flatnonzero(np.any([hits for hits, _, _ in contacts], axis=0))
+                    for index in touching.tolist():
+                        bat_hits[index] = tuple(normals[index].tolist() if hits[index] else None
+                                                for hits, _, normals in contacts)
+                else:
+                    contacts = collide_boxes_with_bats(ball_boxes(balls), self.bats)
+                    bat_hits = list(zip(*(hits.tolist() for hits, _, _ in contacts)))
+                if self.timer.enabled:
+                    self.timer.count('bat_contacts', sum(int(hits.sum()) for hits, _, _ in contacts))
+
+        with self.timer.phase('response'):
+            for ball, walls, hits in zip(balls, nearby_walls, bat_hits):
+                ball.respond(dt, self.gravity, walls, self.bats, hits, self.round_balls)
+
+        with self.timer.phase('integration'):
+            if self.continuous_collision:
+                for ball in balls:
+                    swept = ball.rect.union(ball.rect.move(dt * ball.velocity[0], dt * ball.velocity[1]))
+                    ball.move(dt, self.wall_index.query(swept), self.bats, self.round_balls)
+            else:
+                for ball in balls:
+                    ball.move(dt)
+
+            if self.sleeping:
+                self.update_sleep(balls)
+
+        if self.timer.enabled:
+            self.timer.count('bounces', self.total_bounces() - bounces_before)
+            self.timer.count('asleep', len(self.balls) - len(balls))
+
+    def update_sleep(self, balls):
+        for ball in balls:
+            if ball.velocity[0] == 0.0 and ball.velocity[1] == 0.0:
+                ball.still_steps += 1
+                if ball.still_steps >= SLEEP_STEPS:
+                    ball.asleep = True
+                    self.sleepers.add(ball)
+            else:
+                ball.still_steps = 0
+
+    def wake_near(self, old_bounds, new_bounds):
+        # anything asleep where the bat was or now is might have been knocked, or left with nothing under it
+        left = min(old_bounds[0], new_bounds[0])
+        top = min(old_bounds[1], new_bounds[1])
+        right = max(old_bounds[2], new_bounds[2])
+        bottom = max(old_bounds[3], new_bounds[3])
+        for ball in self.sleepers.overlapping(left, top, right, bottom):
+            self.wake(ball)
+
+    def wake(self, ball):
+        if ball.asleep:
+            self.sleepers.remove(ball)
+            ball.asleep = False
+            ball.still_steps = 0
+
+    def reset_balls(self):
+        self.sleepers.clear()
+        for ball in self.balls:
+            ball.reset(self.rng)
+
+    def refile_sleepers(self):
+        # after ball state has been changed from outside, such as by restoring a snapshot
+        self.sleepers.clear()
+        for ball in self.balls:
+            if ball.asleep:
+                self.sleepers.add(ball)
+
+    def snapshot(self):
+        return take_snapshot(self)
+
+    def restore(self, snapshot):
+        restore_snapshot(self, snapshot)
+
+    def render(self, screen):
+        self.render_static(screen)
+
+        for bat in self.bats:
+            bat.render(screen)
+
+        for ball in self.balls:
+            ball.render(screen)
+
+    def render_static(self, screen):
+        for wall in self.walls:
+            wall.render(screen)
+
+    def sprites(self, stamps, alpha=1.0):
+        """
+        Everything that moves as (surface, position) pairs for Surface.blits, with balls drawn from the stamps. An
+        alpha below 1 draws everything that far between the previous step and the latest one.
+        """
+        sprites = [bat.sprite(alpha) for bat in self.bats]
+        if alpha < 1.0:
+            sprites += [(stamps.box(ball.rect.size, tuple(ball.ball_colour)), ball.interpolated_position(alpha))
+                        for ball in self.balls]
+        else:
+            sprites += [(stamps.box(ball.rect.size, tuple(ball.ball_colour)), ball.rect) for ball in self.balls]
+        return sprites
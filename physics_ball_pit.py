@@ -1,9 +1,21 @@
 #!/usr/bin/env python
 import pygame
 import math
-from random import random
+import random
+import argparse
 from pygame.math import Vector2
 import pygame.gfxdraw
+import numpy as np
+
+from game.profile_overlay import ProfileOverlay
+from game.renderer import StampCache, DirtyRectRenderer
+from pit.adaptive import AdaptiveSteps
+from pit.grid import CellGrid
+from pit.world import (PitWorld, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_MIN_RADIUS, DEFAULT_MAX_RADIUS,
+                       DEFAULT_STIFFNESS, DEFAULT_GRAVITY)
+from sim.profiling import PhaseTimer, NULL_TIMER
+from sim.clock import FixedStepClock
+from sim.scene import load_scene
 
 """
 A Physics toy based on this blog entitled 'Six useful snippets':
@@ -44,33 +56,42 @@ def clamp_vector2(vector_to_clamp, min_vec, max_vec):
     return Vector2(clamped_x, clamped_y)
 
 
-W, H = 500, 375
-MIN_RADIUS, MAX_RADIUS = W / 40, W / 12
-BUCKET_SIZE = 1.1 * MAX_RADIUS
-STIFFNESS = 0.5
-GRAVITY = Vector2(0, 2000)
+W, H = DEFAULT_WIDTH, DEFAULT_HEIGHT
+MIN_RADIUS, MAX_RADIUS = DEFAULT_MIN_RADIUS, DEFAULT_MAX_RADIUS
+STIFFNESS = DEFAULT_STIFFNESS
+GRAVITY = Vector2(DEFAULT_GRAVITY)
 GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+# run the pit on the numpy backed PitWorld rather than looping over the Ball objects below
+USE_ARRAY_WORLD = True
+
+
+# kept between calls so the grid can skip re-bucketing when no ball has changed cell
+broad_phase = CellGrid.for_radii(W, H, MAX_RADIUS)
 
 
 def collisions_between(things):
-    buckets = dict()
-    maybe_collisions = set()
-    for t in things:
-        xmin = int((t.pos.x - t.radius) / BUCKET_SIZE)
-        xmax = int((t.pos.x + t.radius) / BUCKET_SIZE)
-        for x in range(xmin, xmax + 1):
-            ymin = int((t.pos.y - t.radius) / BUCKET_SIZE)
-            ymax = int((t.pos.y + t.radius) / BUCKET_SIZE)
-            for y in range(ymin, ymax + 1):
-                if (x, y) not in buckets:
-                    buckets[(x, y)] = []
-                else:
-                    for other in buckets[(x, y)]:
-                        maybe_collisions.add((other, t))
-                buckets[(x, y)].append(t)
+    positions = np.array([(t.pos.x, t.pos.y) for t in things], dtype=np.float64).reshape(-1, 2)
+    radii = np.array([t.radius for t in things], dtype=np.float64)
+
+    a, b = broad_phase.update(positions)
+    offsets = positions.take(b, axis=0) - positions.take(a, axis=0)
+    touching = np.hypot(offsets[:, 0], offsets[:, 1]) <= radii.take(a) + radii.take(b)
+    return [(things[i], things[j]) for (i, j) in zip(a[touching].tolist(), b[touching].tolist())]
+
 
-    return [(a, b) for (a, b) in maybe_collisions
-            if a.pos.distance_to(b.pos) <= a.radius + b.radius]
+def ball_at(balls, point):
+    """
+    The ball under a point, or None. Like the original handler, the last ball in the list wins when several overlap
+    the point. Only the balls in the grid cells around the point are tested.
+    """
+    # balls have moved since collisions_between last filed them, so file them again first
+    broad_phase.update(np.array([(ball.pos.x, ball.pos.y) for ball in balls], dtype=np.float64).reshape(-1, 2))
+    near = broad_phase.in_box(point[0] - MAX_RADIUS, point[1] - MAX_RADIUS, point[0] + MAX_RADIUS,
+                              point[1] + MAX_RADIUS)
+    for index in sorted(near.tolist(), reverse=True):
+        if balls[index].in_radius(point):
+            return balls[index]
+    return None
 
 
 class Ball:
@@ -87,76 +108,220 @@ class Ball:
         return False
 
 
-pygame.init()
+def make_balls(count=30, seed=None):
+    rng = random.Random(seed)
+    balls = []
+    for i in range(count):
+        r = mix(MIN_RADIUS, MAX_RADIUS, rng.random())
+        pos = Vector2(mix(r, W - r, rng.random()), mix(r, H - r, rng.random()))
+        color = pygame.Color("#000000")
+        color.hsla = 360 * ((i * GOLDEN_RATIO) % 1), 50, 70, 100
+        balls.append(Ball(pos, r, color))
+    return balls
+
 
-screen = pygame.display.set_mode((W, H))
-background = pygame.Surface((W, H))
-background.fill(pygame.Color("#FFFFFF"))
+def make_world(balls, adaptive=None):
+    return PitWorld(W, H, [(ball.pos.x, ball.pos.y) for ball in balls], [ball.radius for ball in balls],
+                    [tuple(ball.color) for ball in balls], gravity=GRAVITY, stiffness=STIFFNESS, adaptive=adaptive)
 
-balls = []
-for i in range(30):
-    r = mix(MIN_RADIUS, MAX_RADIUS, random())
-    pos = Vector2(mix(r, W - r, random()), mix(r, H - r, random()))
-    color = pygame.Color("#000000")
-    color.hsla = 360 * ((i * GOLDEN_RATIO) % 1), 50, 70, 100
-    balls.append(Ball(pos, r, color))
 
-dt, iterations = 1 / 60, 5
+def draw_world(screen, world):
+    for x, y, radius, color in zip(world.pos[:, 0].astype(int), world.pos[:, 1].astype(int),
+                                   world.radius.astype(int), world.colour.tolist()):
+        pygame.gfxdraw.aacircle(screen, x, y, radius, color)
+        pygame.gfxdraw.filled_circle(screen, x, y, radius, color)
 
-clock = pygame.time.Clock()
-running = True
-held_ball = None
-while running:
-    time_delta = clock.tick(60) / 1000.0
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+def world_stamps(world, stamps):
+    # balls never change size or colour, so which stamp each one uses only has to be worked out once
+    return [stamps.circle(radius, tuple(colour))
+            for radius, colour in zip(world.radius.astype(int).tolist(), world.colour.tolist())]
 
-        if event.type == pygame.MOUSEBUTTONDOWN:
-            if event.button == 1:
-                mouse_pos = Vector2(pygame.mouse.get_pos())
-                for ball in balls:
-                    if ball.in_radius(mouse_pos):
-                        held_ball = ball
 
-        if event.type == pygame.MOUSEBUTTONUP:
-            if event.button == 1:
-                held_ball = None
+def world_sprites(world, ball_stamps, alpha=1.0):
+    # each ball's stamp and its top left corner, to draw the whole pit with one Surface.blits call
+    positions = world.pos if alpha >= 1.0 else world.interpolate(alpha)
+    radii = world.radius.astype(int)
+    corners = (positions.astype(int) - radii[:, None]).tolist()
+    return list(zip(ball_stamps, corners))
 
+
+def ball_sprites(balls, stamps, alpha=1.0):
+    sprites = []
     for ball in balls:
-        # Verlet integration
-        next_pos = (2 * ball.pos) - ball.prev_pos + (GRAVITY * (dt * dt))
-        ball.prev_pos = ball.pos
-        ball.pos = next_pos
+        radius = int(ball.radius)
+        pos = ball.pos if alpha >= 1.0 else ball.prev_pos.lerp(ball.pos, alpha)
+        sprites.append((stamps.circle(radius, tuple(ball.color)), (int(pos.x) - radius, int(pos.y) - radius)))
+    return sprites
 
-    if held_ball is not None:
-        held_ball.pos = Vector2(pygame.mouse.get_pos())
+
+def step_balls(balls, dt, iterations, held_ball=None, held_pos=None, timer=NULL_TIMER):
+    with timer.phase('integration'):
+        for ball in balls:
+            # Verlet integration
+            next_pos = (2 * ball.pos) - ball.prev_pos + (GRAVITY * (dt * dt))
+            ball.prev_pos = ball.pos
+            ball.pos = next_pos
+
+        if held_ball is not None:
+            held_ball.pos = Vector2(held_pos)
 
     # Solve constraints iteratively
     for _ in range(iterations):
+        with timer.phase('collisions'):
+            contacts = collisions_between(balls)
+        timer.count('contacts', len(contacts))
+
         # Resolve overlaps:
-        for (a, b) in collisions_between(balls):
-            a2b = (b.pos - a.pos).normalize()
-            distance = a.pos.distance_to(b.pos)
-            overlap = (a.radius + b.radius) - distance
-            a.pos = a.pos - a2b * (STIFFNESS * overlap * (b.mass / (a.mass + b.mass)))
-            b.pos = b.pos + a2b * (STIFFNESS * overlap * (a.mass / (a.mass + b.mass)))
-
-        # Stay on screen:
-        for b in balls:
-            clamped = clamp_vector2(b.pos, Vector2(b.radius, b.radius),
-                                    Vector2(W - b.radius, H - b.radius))
-
-            if clamped != b.pos:
-                b.pos = mix_vector2(b.pos, clamped, STIFFNESS)
-                # damping
-                b.prev_pos = mix_vector2(b.prev_pos, b.pos, 0.001)
+        with timer.phase('response'):
+            resolve_overlaps(contacts)
+            stay_on_screen(balls)
+
+
+def resolve_overlaps(contacts):
+    for (a, b) in contacts:
+        a2b = (b.pos - a.pos).normalize()
+        distance = a.pos.distance_to(b.pos)
+        overlap = (a.radius + b.radius) - distance
+        a.pos = a.pos - a2b * (STIFFNESS * overlap * (b.mass / (a.mass + b.mass)))
+        b.pos = b.pos + a2b * (STIFFNESS * overlap * (a.mass / (a.mass + b.mass)))
+
+
+def stay_on_screen(balls):
+    for b in balls:
+        clamped = clamp_vector2(b.pos, Vector2(b.radius, b.radius),
+                                Vector2(W - b.radius, H - b.radius))
+
+        if clamped != b.pos:
+            b.pos = mix_vector2(b.pos, clamped, STIFFNESS)
+            # damping
+            b.prev_pos = mix_vector2(b.prev_pos, b.pos, 0.001)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Physics ball pit')
+    parser.add_argument('--profile', action='store_true', help='time each phase of the update and show it on screen')
+    parser.add_argument('--trace', help='save a Chrome trace of every frame to this file on exit')
+    parser.add_argument('--full-redraw', action='store_true',
+                        help='draw every ball with gfxdraw and flip the whole window each frame')
+    parser.add_argument('--scene', help='load the balls from this scene file')
+    parser.add_argument('--seed', type=int, default=None, help='seed where the balls start')
+    parser.add_argument('--lockstep', action='store_true',
+                        help='run exactly one physics step per frame, so a seeded run replays the same every time')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='give each step as many constraint passes and substeps as the pit needs, not always 5')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='with --adaptive, milliseconds of physics a step can use before it stops doing extra')
+    args = parser.parse_args()
+
+    pygame.init()
+
+    adaptive = None
+    if args.adaptive:
+        adaptive = AdaptiveSteps(budget=args.budget / 1000.0 if args.budget is not None else None)
+
+    balls = None
+    world = None
+    if args.scene:
+        try:
+            world = load_scene(args.scene, 'pit', adaptive=adaptive)
+        except ValueError as error:
+            parser.error(str(error))
+    else:
+        balls = make_balls(seed=args.seed)
+        if USE_ARRAY_WORLD:
+            world = make_world(balls, adaptive)
+    width, height = (int(world.width), int(world.height)) if world is not None else (W, H)
+
+    screen = pygame.display.set_mode((width, height))
+    background = pygame.Surface((width, height))
+    background.fill(pygame.Color("#FFFFFF"))
+    background = background.convert()
+
+    iterations = 5
+    # the pit always steps 1/60th of a second at a time, however long frames take to draw
+    sim_clock = FixedStepClock(1 / 60, lockstep=args.lockstep)
+
+    timer = NULL_TIMER
+    overlay = None
+    if args.profile or args.trace:
+        timer = PhaseTimer(trace=args.trace is not None)
+        if args.profile:
+            overlay = ProfileOverlay(timer, (10, 10), "#000000")
+    if world is not None:
+        world.timer = timer
+
+    # the background is plain white, so the balls' soft edges can be baked into their stamps
+    stamps = StampCache(background=(255, 255, 255))
+    renderer = DirtyRectRenderer(screen, background)
+    if world is not None:
+        ball_stamps = world_stamps(world, stamps)
+
+    clock = pygame.time.Clock()
+    running = True
+    held_ball = None
+    while running:
+        time_delta = clock.tick(60) / 1000.0
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1:
+                    mouse_pos = Vector2(pygame.mouse.get_pos())
+                    if world is not None:
+                        picked = world.pick(mouse_pos)
+                        if picked >= 0:
+                            world.hold(picked, mouse_pos)
+                    else:
+                        held_ball = ball_at(balls, mouse_pos)
+
+            if event.type == pygame.MOUSEBUTTONUP:
+                if event.button == 1:
+                    held_ball = None
+                    if world is not None:
+                        world.release()
+
+        for _ in range(sim_clock.advance(time_delta)):
+            if world is not None:
+                if world.held_index >= 0:
+                    world.held_position = pygame.mouse.get_pos()
+                world.step(sim_clock.step, iterations)
+            else:
+                step_balls(balls, sim_clock.step, iterations, held_ball, pygame.mouse.get_pos(), timer)
 
         # Draw:
-        screen.blit(background, (0, 0))
-        for ball in balls:
-            pygame.gfxdraw.aacircle(screen, int(ball.pos.x), int(ball.pos.y), int(ball.radius), ball.color)
-            pygame.gfxdraw.filled_circle(screen, int(ball.pos.x), int(ball.pos.y), int(ball.radius), ball.color)
+        with timer.phase('render'):
+            if args.full_redraw:
+                screen.blit(background, (0, 0))
+                if world is not None:
+                    draw_world(screen, world)
+                else:
+                    for ball in balls:
+                        pygame.gfxdraw.aacircle(screen, int(ball.pos.x), int(ball.pos.y), int(ball.radius),
+                                                ball.color)
+                        pygame.gfxdraw.filled_circle(screen, int(ball.pos.x), int(ball.pos.y), int(ball.radius),
+                                                     ball.color)
+                if overlay is not None:
+                    overlay.render(screen)
+
+                pygame.display.flip()
+            else:
+                renderer.begin()
+                if world is not None:
+                    renderer.draw(world_sprites(world, ball_stamps, sim_clock.alpha))
+                else:
+                    renderer.draw(ball_sprites(balls, stamps, sim_clock.alpha))
+                if overlay is not None:
+                    renderer.mark(overlay.render(screen))
+                renderer.end()
+
+        timer.frame()
+
+    if args.trace:
+        timer.export_chrome_trace(args.trace)
+
 
-    pygame.display.flip()
+if __name__ == '__main__':
+    main()
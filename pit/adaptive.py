@@ -0,0 +1,144 @@
+import math
+import time
+from collections import Counter
+
+import numpy as np
+
+"""
+Lets the ball pit spend as many constraint passes on a step as the scene actually needs.
+
+With a fixed count every step pays for the worst case: balls falling through empty space get five passes when one
+finds nothing to push, and a pile that has just been hit still jitters after five. An AdaptiveSteps handed to
+PitWorld measures how deep the deepest overlap is (between two balls, or a ball into a wall) at every pass instead,
+and
+
+  - stops as soon as nothing overlaps by more than tolerance, however few passes that takes,
+  - keeps going past the usual count while something still overlaps by more than max_penetration and each pass is
+    still taking a good share off it, up to max_iterations passes. A pile resting under gravity always overlaps a
+    little and pushing it apart all at once barely gains anything after the first few passes, so it doesn't get
+    more; a pile that has just been knocked into does,
+  - splits the step into up to max_substeps smaller ones when a ball is about to move further in one step than
+    max_move times the smallest radius, which is how far it can go before it starts skipping through other balls.
+
+The overlaps are measured in the smallest ball's radius too, so the same settings suit any size of ball.
+
+All of which stops at budget seconds a step: once a step has used that up each substep gets a single pass and no
+more, and a step is only split as many times as the last few steps' timings say will fit.
+
+Every step's choices are kept as metrics - the passes and substeps it took and the overlap it left behind - and
+counted on the world's timer as 'iterations' and 'substeps', so the profile overlay and the benchmark show them.
+"""
+
+# how deep an overlap can be left, and how deep one has to be to earn more passes than usual, in smallest radii
+TOLERANCE = 0.02
+MAX_PENETRATION = 0.1
+MAX_ITERATIONS = 20
+# the share of the deepest overlap a pass past the usual count has to take off for another to be worth doing
+MIN_PROGRESS = 0.1
+# a step is split when a ball would move more than this much of the smallest radius in it
+MAX_MOVE = 0.5
+MAX_SUBSTEPS = 4
+# how quickly the time a pass takes, used to decide how many substeps fit in the budget, follows the latest step
+PASS_TIME_SMOOTHING = 0.2
+
+
+class AdaptiveSteps:
+    def __init__(self, tolerance=TOLERANCE, max_penetration=MAX_PENETRATION, max_iterations=MAX_ITERATIONS,
+                 max_move=MAX_MOVE, max_substeps=MAX_SUBSTEPS, budget=None):
+        self.tolerance = tolerance
+        self.max_penetration = max_penetration
+        self.max_iterations = max_iterations
+        self.max_move = max_move
+        self.max_substeps = max_substeps
+        self.budget = budget
+
+        # the last step
+        self.iterations = 0
+        self.substeps = 0
+        self.penetration = 0.0
+        self.over_budget = False
+        # every step so far
+        self.steps = 0
+        self.total_iterations = 0
+        self.total_substeps = 0
+        self.steps_over_budget = 0
+        self.iteration_counts = Counter()
+        self.pass_seconds = None
+
+    def step(self, world, dt, iterations):
+        started = time.perf_counter()
+        substeps = self.choose_substeps(world, dt, iterations)
+        self.over_budget = False
+        passes = 0
+
+        if substeps > 1:
+            # a Verlet body's velocity is how far it moved last step, so it has to be scaled down to the substep
+            # and back up again afterwards
+            world.prev_pos[:] = world.pos - (world.pos - world.prev_pos) / substeps
+        substep_dt = dt / substeps
+        smallest = world.radius.min()
+        tolerance = self.tolerance * smallest
+        max_penetration = self.max_penetration * smallest
+        candidates = None
+        deepest = 0.0
+        for _ in range(substeps):
+            world.begin_step(substep_dt)
+            previous = math.inf
+            for iteration in range(1, self.max_iterations + 1):
+                candidates, deepest = world.solve_pass(tolerance)
+                passes += 1
+                if deepest <= tolerance:
+                    break
+                if iteration >= iterations and (deepest <= max_penetration or
+                                                deepest > previous * (1.0 - MIN_PROGRESS)):
+                    break
+                if self.budget is not None and time.perf_counter() - started > self.budget:
+                    self.over_budget = True
+                    break
+                previous = deepest
+        if substeps > 1:
+            world.prev_pos[:] = world.pos - (world.pos - world.prev_pos) * substeps
+        # sleeping counts whole steps, so it comes once the substeps are all done and velocities are back to the
+        # whole step's
+        world.end_step(dt, candidates)
+
+        seconds = time.perf_counter() - started
+        self.record(world, passes, substeps, deepest, seconds)
+
+    def choose_substeps(self, world, dt, iterations):
+        if self.max_substeps <= 1 or len(world.radius) == 0:
+            return 1
+        # how far each ball is about to go: the same as last step, plus what gravity adds
+        moves = (world.pos - world.prev_pos + world.gravity * (dt * dt)).view(np.complex128).ravel()
+        furthest = math.sqrt(np.max(moves.real * moves.real + moves.imag * moves.imag))
+        substeps = min(self.max_substeps, max(1, math.ceil(furthest / (self.max_move * world.radius.min()))))
+        if substeps > 1 and self.budget is not None and self.pass_seconds:
+            substeps = min(substeps, max(1, int(self.budget / (self.pass_seconds * max(iterations, 1)))))
+        return substeps
+
+    def record(self, world, passes, substeps, penetration, seconds):
+        self.iterations = passes
+        self.substeps = substeps
+        # in pixels, for anyone watching
+        self.penetration = penetration
+        self.steps += 1
+        self.total_iterations += passes
+        self.total_substeps += substeps
+        self.steps_over_budget += self.over_budget
+        self.iteration_counts[passes] += 1
+        per_pass = seconds / max(passes, 1)
+        if self.pass_seconds is None:
+            self.pass_seconds = per_pass
+        else:
+            self.pass_seconds += (per_pass - self.pass_seconds) * PASS_TIME_SMOOTHING
+
+        world.timer.count('iterations', passes)
+        world.timer.count('substeps', substeps)
+        if self.over_budget:
+            world.timer.count('over_budget')
+
+    def summary(self):
+        steps = max(self.steps, 1)
+        return {'steps': self.steps, 'mean_iterations': self.total_iterations / steps,
+                'mean_substeps': self.total_substeps / steps, 'steps_over_budget': self.steps_over_budget,
+                'iteration_counts': dict(sorted(self.iteration_counts.items()))}
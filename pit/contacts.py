@@ -0,0 +1,105 @@
+import numpy as np
+
+"""
+A contact cache for the ball pit that carries over between iterations and frames.
+
+Rather than asking the grid for candidate pairs on every constraint iteration, the cache keeps a Verlet list: every
+pair of balls that were within margin of touching when it was built. Until some ball has moved more than half the
+margin from where it was at that point, no two balls can have got close enough to touch without already being on
+the list, so the list stays good and the broad phase is skipped entirely - in a dense pile that's moving slowly,
+that's most iterations of most frames. The list also holds far fewer pairs than the grid hands out, since pairs in
+neighbouring cells that are nowhere near each other are dropped when it's built.
+
+Each pair on the list keeps a running total of how far it was pushed apart over the last step. A pile resting under
+gravity needs much the same push every step to hold it up, so the next step starts by giving each pair that much
+again (scaled by WARM_START, and never more than the pair actually overlaps) before the iterations go to work on
+whatever is left. The totals are carried across rebuilds for pairs still on the list.
+"""
+
+# how far past touching a pair can be and still be kept on the list, as a fraction of the biggest ball's radius
+CONTACT_MARGIN = 0.5
+# how much of last step's push each pair starts the next step with
+WARM_START = 0.8
+
+
+class ContactCache:
+    def __init__(self, grid, margin):
+        self.grid = grid
+        self.margin = margin
+        self.pairs = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+        self.pushed = np.empty(0, dtype=np.float64)
+        self.rebuilds = 0
+        self._built_pos = None
+
+    def update(self, world):
+        """
+        Returns the pairs that might be touching, rebuilding them first if anything has moved too far since the
+        last time. The same tuple comes back for as long as it stays good.
+        """
+        if self._built_pos is None or len(self._built_pos) != len(world.pos) or self.moved_too_far(world.pos):
+            self.rebuild(world)
+        return self.pairs
+
+    def moved_too_far(self, positions):
+        moved = (positions - self._built_pos).view(np.complex128).ravel()
+        limit = 0.5 * self.margin
+        return np.max(moved.real * moved.real + moved.imag * moved.imag, initial=0.0) > limit * limit
+
+    def rebuild(self, world):
+        a, b = self.grid.update(world.pos)
+        points = world.pos.view(np.complex128).ravel()
+        near = np.abs(points.take(b) - points.take(a)) <= world.radius.take(a) + world.radius.take(b) + self.margin
+        a = a[near]
+        b = b[near]
+
+        # hand each pair that was pushed last time its push again, if it's still on the list
+        pushed = np.zeros(len(a))
+        old_slots = np.flatnonzero(self.pushed)
+        if len(old_slots) and len(a):
+            count = len(world.pos)
+            old_a = self.pairs[0].take(old_slots)
+            old_b = self.pairs[1].take(old_slots)
+            old_keys = np.minimum(old_a, old_b) * count + np.maximum(old_a, old_b)
+            old_order = np.argsort(old_keys)
+            old_keys = old_keys.take(old_order)
+            keys = np.minimum(a, b) * count + np.maximum(a, b)
+            # looking up sorted keys in sorted keys walks through memory in order, which is a lot quicker
+            order = np.argsort(keys)
+            keys = keys.take(order)
+            slots = np.minimum(np.searchsorted(old_keys, keys), len(old_keys) - 1)
+            found = old_keys.take(slots) == keys
+            pushed[order[found]] = self.pushed.take(old_slots.take(old_order.take(slots[found])))
+
+        self.pairs = (a, b)
+        self.pushed = pushed
+        self._built_pos = world.pos.copy()
+        self.rebuilds += 1
+
+    def touching(self, world):
+        """
+        The places in the list of the pairs that overlap and aren't both asleep.
+        """
+        a, b = self.pairs
+        points = world.pos.view(np.complex128).ravel()
+        touching = np.abs(points.take(b) - points.take(a)) <= world.radius.take(a) + world.radius.take(b)
+        if world.asleep_count:
+            touching &= world.awake.take(a) | world.awake.take(b)
+        return np.flatnonzero(touching)
+
+    def warm_start(self, world):
+        warm = np.flatnonzero(self.pushed)
+        previous = self.pushed.take(warm)
+        self.pushed[:] = 0.0
+        if len(warm) == 0:
+            return
+
+        a = self.pairs[0].take(warm)
+        b = self.pairs[1].take(warm)
+        points = world.pos.view(np.complex128).ravel()
+        overlap = world.radius.take(a) + world.radius.take(b) - np.abs(points.take(b) - points.take(a))
+        amounts = np.minimum(previous * WARM_START, overlap)
+        if world.asleep_count:
+            amounts[~(world.awake.take(a) | world.awake.take(b))] = 0.0
+        keep = amounts > 0.0
+        warm = warm[keep]
+        self.pushed[warm] = world.resolve_overlaps(a[keep], b[keep], amounts[keep])
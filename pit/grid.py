@@ -0,0 +1,129 @@
+import math
+
+import numpy as np
+
+"""
+A uniform grid broad phase for the ball pit.
+
+The cells are at least as wide as the biggest ball, so every ball is stored once - in the cell holding its centre -
+and anything it could be touching has to sit in the same cell or one of the eight around it. Balls are bucketed by
+sorting them on their cell id into flat arrays, so a cell's contents are just a slice of one index array.
+
+The grid remembers which cell every ball was in. When nothing has changed cell since the last update (which is most
+constraint iterations, and most frames in a settled pile) the candidate pairs from last time are handed straight
+back rather than being rebuilt.
+
+The same buckets answer region queries. Cell ids run along each row, so the cells a box covers in one row are one
+run of the sorted order, and the balls in them are one slice of it - a box query is a slice per row it spans, and
+costs next to nothing beyond the balls it finds.
+"""
+
+# offsets to the cells 'after' a cell, so each pair of neighbouring cells is only visited once
+HALF_NEIGHBOURHOOD = ((1, 0), (-1, 1), (0, 1), (1, 1))
+
+
+class CellGrid:
+    def __init__(self, width, height, cell_size):
+        self.cell_size = float(cell_size)
+        self.columns = max(1, int(math.ceil(width / self.cell_size)))
+        self.rows = max(1, int(math.ceil(height / self.cell_size)))
+
+        self.cells = np.empty(0, dtype=np.int64)
+        self.order = np.empty(0, dtype=np.intp)
+        self.cell_starts = np.zeros(self.columns * self.rows + 1, dtype=np.intp)
+        self.candidates = (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp))
+        self.rebuilds = 0
+
+        self._scratch = np.empty((0, 2), dtype=np.float64)
+        self._cell_xy = np.empty((0, 2), dtype=np.int64)
+        self._new_cells = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def for_radii(cls, width, height, max_radius, margin=0.0):
+        return cls(width, height, 2.0 * max_radius + margin)
+
+    def update(self, positions):
+        """
+        Re-buckets the balls at these positions. Returns the candidate pairs as two index arrays - every pair of
+        balls close enough that they may be touching, each pair listed once.
+        """
+        count = len(positions)
+        if len(self.cells) != count:
+            self._scratch = np.empty((count, 2), dtype=np.float64)
+            self._cell_xy = np.empty((count, 2), dtype=np.int64)
+            self._new_cells = np.empty(count, dtype=np.int64)
+            self.cells = np.full(count, -1, dtype=np.int64)
+
+        # balls that have strayed off the grid are kept in the edge cells, which only ever brings them closer
+        # to their neighbours so nothing can be missed
+        np.floor_divide(positions, self.cell_size, out=self._scratch)
+        np.clip(self._scratch[:, 0], 0, self.columns - 1, out=self._scratch[:, 0])
+        np.clip(self._scratch[:, 1], 0, self.rows - 1, out=self._scratch[:, 1])
+        self._cell_xy[:] = self._scratch
+        np.multiply(self._cell_xy[:, 1], self.columns, out=self._new_cells)
+        self._new_cells += self._cell_xy[:, 0]
+
+        if np.array_equal(self._new_cells, self.cells):
+            return self.candidates
+
+        self.cells, self._new_cells = self._new_cells, self.cells
+        self.rebuilds += 1
+
+        # counting how many balls land in each cell gives every cell its slice of the sorted order, and a stable
+        # sort on the cell ids fills those slices in
+        counts = np.bincount(self.cells, minlength=self.columns * self.rows)
+        np.cumsum(counts, out=self.cell_starts[1:])
+        self.order = np.argsort(self.cells, kind='stable')
+
+        self.candidates = self._emit_pairs()
+        return self.candidates
+
+    def in_box(self, left, top, right, bottom):
+        """
+        Every ball in the cells that the box from (left, top) to (right, bottom) covers, as of the last update. That
+        includes every ball whose centre is inside the box, along with some that are near it.
+        """
+        # clamped onto the grid the same way the balls are, so balls that have strayed off it are found too
+        first_column = min(max(int(left // self.cell_size), 0), self.columns - 1)
+        last_column = min(max(int(right // self.cell_size), 0), self.columns - 1)
+        first_row = min(max(int(top // self.cell_size), 0), self.rows - 1)
+        last_row = min(max(int(bottom // self.cell_size), 0), self.rows - 1)
+
+        cell_starts = self.cell_starts
+        slices = [self.order[cell_starts[row * self.columns + first_column]:
+                             cell_starts[row * self.columns + last_column + 1]]
+                  for row in range(first_row, last_row + 1)]
+        if len(slices) == 1:
+            return slices[0]
+        return np.concatenate(slices)
+
+    def _emit_pairs(self):
+        count = len(self.order)
+        sorted_cells = self.cells.take(self.order)
+        sorted_x = self._cell_xy[:, 0].take(self.order)
+        sorted_y = self._cell_xy[:, 1].take(self.order)
+        slots = np.arange(count)
+
+        # the balls after this one in its own cell
+        starts = [slots + 1]
+        ends = [self.cell_starts.take(sorted_cells + 1)]
+
+        for offset_x, offset_y in HALF_NEIGHBOURHOOD:
+            neighbour_x = sorted_x + offset_x
+            neighbour_y = sorted_y + offset_y
+            on_grid = ((neighbour_x >= 0) & (neighbour_x < self.columns) & (neighbour_y < self.rows))
+            neighbour = np.where(on_grid, neighbour_y * self.columns + neighbour_x, 0)
+            cell_start = self.cell_starts.take(neighbour)
+            starts.append(cell_start)
+            ends.append(np.where(on_grid, self.cell_starts.take(neighbour + 1), cell_start))
+
+        starts = np.concatenate(starts)
+        spans = np.concatenate(ends) - starts
+        owners = np.tile(slots, len(HALF_NEIGHBOURHOOD) + 1)
+
+        # each owner's run of partners is a consecutive slice of the sorted order, so the partners are just a
+        # counter that restarts at each run's start slot
+        firsts = np.repeat(owners, spans)
+        seconds = np.arange(len(firsts)) + np.repeat(starts - (np.cumsum(spans) - spans), spans)
+        return self.order.take(firsts), self.order.take(seconds)
+
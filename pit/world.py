@@ -0,0 +1,497 @@
+import math
+import colorsys
+
+import numpy as np
+
+from pit.contacts import CONTACT_MARGIN, ContactCache
+from pit.grid import CellGrid
+from sim.profiling import NULL_TIMER
+
+"""
+An array backed version of the Verlet ball pit.
+
+Instead of every ball owning its own Vector2 position, all of the bodies in the pit live in a handful of contiguous
+numpy arrays (positions, previous positions, radii, masses & colours). Each stage of the simulation - the Verlet
+integration, the overlap resolution and keeping everything on screen - then runs over the whole pit at once rather
+than looping over Python objects, which is what lets it cope with tens of thousands of balls.
+
+Balls that have come to rest are put to sleep a whole island at a time, an island being a group of balls that are
+touching one another. A sleeping ball isn't integrated and pairs of sleeping balls aren't tested against each
+other, so a settled heap costs little more than keeping its balls in the grid. As soon as an awake ball (the one
+held by the mouse included) touches a sleeper, the sleeper's whole island wakes up. Sleeping a ball on its own
+while its neighbours were still awake would leave them pushing against something that can't give, which just
+keeps them jiggling.
+
+The grid the broad phase keeps also answers questions about regions of the pit - the ball under a point, the balls
+in a circle or a box, the nearest few to a point - by only looking at the balls in the cells the region covers. It
+is brought up to date with the balls' positions the first time it is asked something after a step, and then serves
+any number of queries until the next one.
+"""
+
+GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+
+# the pit physics_ball_pit.py has always opened with
+DEFAULT_WIDTH, DEFAULT_HEIGHT = 500, 375
+DEFAULT_MIN_RADIUS, DEFAULT_MAX_RADIUS = DEFAULT_WIDTH / 40, DEFAULT_WIDTH / 12
+DEFAULT_STIFFNESS = 0.5
+DEFAULT_GRAVITY = (0.0, 2000.0)
+
+# an island goes to sleep once all of its balls have been slower than SLEEP_SPEED (pixels per second) for
+# SLEEP_STEPS steps in a row
+SLEEP_SPEED = 5.0
+SLEEP_STEPS = 30
+# balls this close count as touching when islands are worked out, so a pile doesn't split over a hairline gap
+ISLAND_MARGIN = 1.0
+# working out islands isn't free, so it's only done every so many steps
+ISLAND_CHECK_STEPS = 10
+
+
+class PitWorld:
+    def __init__(self, width, height, positions, radii, colours=None,
+                 gravity=DEFAULT_GRAVITY, stiffness=DEFAULT_STIFFNESS, sleeping=True, solver=None,
+                 contact_cache=True, adaptive=None):
+        self.width = width
+        self.height = height
+        self.gravity = np.array(gravity, dtype=np.float64)
+        self.stiffness = stiffness
+
+        self.pos = np.array(positions, dtype=np.float64).reshape(-1, 2)
+        self.prev_pos = self.pos.copy()
+        self.radius = np.array(radii, dtype=np.float64).reshape(-1)
+        self.mass = self.radius * self.radius
+        if colours is None:
+            self.colour = np.full((len(self.radius), 4), 255, dtype=np.uint8)
+        else:
+            self.colour = np.array(colours, dtype=np.uint8).reshape(-1, 4)
+
+        max_radius = self.radius.max(initial=1.0)
+        self.max_radius = max_radius
+        if contact_cache:
+            # the grid's cells have to be wide enough to find every pair within the cache's margin
+            margin = CONTACT_MARGIN * max_radius
+            self.grid = CellGrid.for_radii(width, height, max_radius, margin)
+            self.contacts = ContactCache(self.grid, margin)
+        else:
+            self.grid = CellGrid.for_radii(width, height, max_radius)
+            self.contacts = None
+
+        # whether the grid has been told where the balls are since they last moved, for region queries
+        self._index_current = False
+
+        # spare position buffer so integration can swap arrays instead of allocating new ones
+        self._next_pos = np.empty_like(self.pos)
+
+        self.held_index = -1
+        self.held_position = None
+
+        self.sleeping = sleeping
+        self.awake = np.ones(len(self.radius), dtype=bool)
+        self.asleep_count = 0
+        self.still_steps = np.zeros(len(self.radius), dtype=np.int64)
+        self.island = np.arange(len(self.radius))
+        self.steps_since_check = 0
+        # the candidate pairs with at least one ball awake, kept until the grid or who is asleep changes
+        self._active_pairs = None
+        self._active_source = None
+
+        # a ColouredSolver, if given, resolves overlaps Gauss-Seidel style in place of resolve_overlaps
+        self.solver = solver
+        # an AdaptiveSteps, if given, picks how many passes and substeps each step gets in place of a fixed count
+        self.adaptive = adaptive
+
+        self.timer = NULL_TIMER
+
+    @classmethod
+    def random(cls, count, width, height, min_radius, max_radius, seed=None, **kwargs):
+        """
+        Builds a pit the same way the original script does - random radii and positions that keep every ball on
+        screen, coloured by stepping around the hue wheel by the golden ratio.
+        """
+        rng = np.random.default_rng(seed)
+        radii = mix(min_radius, max_radius, rng.random(count))
+        positions = np.empty((count, 2))
+        positions[:, 0] = mix(radii, width - radii, rng.random(count))
+        positions[:, 1] = mix(radii, height - radii, rng.random(count))
+        colours = np.empty((count, 4), dtype=np.uint8)
+        for i in range(count):
+            red, green, blue = colorsys.hls_to_rgb((i * GOLDEN_RATIO) % 1, 0.7, 0.5)
+            colours[i] = (int(red * 255), int(green * 255), int(blue * 255), 255)
+        return cls(width, height, positions, radii, colours, **kwargs)
+
+    @classmethod
+    def default(cls, count=30, seed=None, **kwargs):
+        return cls.random(count, DEFAULT_WIDTH, DEFAULT_HEIGHT, DEFAULT_MIN_RADIUS, DEFAULT_MAX_RADIUS, seed=seed,
+                          **kwargs)
+
+    def __len__(self):
+        return len(self.radius)
+
+    def refresh_index(self):
+        """
+        Brings the grid up to date for region queries. The queries do this themselves, so it's only worth calling
+        to get it done at a time of your choosing.
+        """
+        if not self._index_current:
+            self.grid.update(self.pos)
+            self._index_current = True
+
+    def invalidate_index(self):
+        # for anything that moves balls other than step(), so the next query sees where they are now
+        self._index_current = False
+
+    def near_box(self, left, top, right, bottom):
+        """
+        The balls that might overlap the box from (left, top) to (right, bottom) - every ball whose centre is within
+        the biggest radius of it, along with a few that aren't.
+        """
+        self.refresh_index()
+        reach = self.max_radius
+        return self.grid.in_box(left - reach, top - reach, right + reach, bottom + reach)
+
+    def pick(self, point):
+        """
+        Returns the index of the ball under a point, or -1 if there isn't one. Like the original mouse handler
+        the last ball in the list wins when several overlap the point.
+        """
+        x, y = float(point[0]), float(point[1])
+        near = self.near_box(x, y, x, y)
+        points = self.pos.view(np.complex128).ravel()
+        inside = near[np.abs(points.take(near) - complex(x, y)) < self.radius.take(near)]
+        if len(inside) == 0:
+            return -1
+        return int(inside.max())
+
+    def query_circle(self, centre, radius):
+        """
+        The indices of the balls that overlap a circle, in order.
+        """
+        x, y = float(centre[0]), float(centre[1])
+        near = self.near_box(x - radius, y - radius, x + radius, y + radius)
+        points = self.pos.view(np.complex128).ravel()
+        return np.sort(near[np.abs(points.take(near) - complex(x, y)) < radius + self.radius.take(near)])
+
+    def query_box(self, left, top, right, bottom):
+        """
+        The indices of the balls that overlap the box from (left, top) to (right, bottom), in order.
+        """
+        near = self.near_box(left, top, right, bottom)
+        points = self.pos.view(np.complex128).ravel().take(near)
+        # how far each centre is from the nearest point of the box, which is nothing for centres inside it
+        offset_x = points.real - np.clip(points.real, left, right)
+        offset_y = points.imag - np.clip(points.imag, top, bottom)
+        return np.sort(near[np.hypot(offset_x, offset_y) < self.radius.take(near)])
+
+    def nearest(self, point, count=1):
+        """
+        The indices of the count balls whose centres are nearest to point, nearest first (and lowest index first
+        between balls the same distance away).
+        """
+        count = min(count, len(self))
+        if count <= 0:
+            return np.empty(0, dtype=np.intp)
+        self.refresh_index()
+        x, y = float(point[0]), float(point[1])
+        points = self.pos.view(np.complex128).ravel()
+
+        # look in a square around the point that grows until the count'th nearest ball found in it is no further
+        # away than the square reaches, at which point nothing outside the square can be nearer
+        reach = self.grid.cell_size
+        while True:
+            near = self.grid.in_box(x - reach, y - reach, x + reach, y + reach)
+            if len(near) < count:
+                reach *= 2.0
+                continue
+            distances = np.abs(points.take(near) - complex(x, y))
+            furthest = np.partition(distances, count - 1)[count - 1]
+            if furthest <= reach:
+                return near.take(np.lexsort((near, distances))[:count])
+            reach = furthest
+
+    def interpolate(self, alpha):
+        """
+        Positions alpha of the way from the last step to this one, for drawing between fixed steps. After a step
+        prev_pos holds where each ball was before it, so no extra copy has to be kept.
+        """
+        return self.prev_pos + (self.pos - self.prev_pos) * alpha
+
+    def hold(self, index, position):
+        self.held_index = index
+        self.held_position = position
+        self.wake(np.array([index]))
+
+    def release(self):
+        self.held_index = -1
+        self.held_position = None
+
+    def wake(self, indices):
+        indices = indices[~self.awake.take(indices)]
+        if len(indices) == 0:
+            return
+        # everything that fell asleep with these balls wakes along with them
+        woken = np.isin(self.island, self.island.take(indices)) & ~self.awake
+        self.awake[woken] = True
+        self.still_steps[woken] = 0
+        self.asleep_count -= int(np.count_nonzero(woken))
+        self._active_pairs = None
+
+    def step(self, dt, iterations=5):
+        if self.asleep_count == len(self.radius):
+            # nothing is moving and nothing can until a ball is picked up
+            self.timer.count('asleep', self.asleep_count)
+            return
+        self._index_current = False
+
+        if self.adaptive is not None:
+            self.adaptive.step(self, dt, iterations)
+            return
+
+        self.begin_step(dt)
+        candidates = None
+        # Solve constraints iteratively
+        for _ in range(iterations):
+            candidates, _ = self.solve_pass()
+        self.end_step(dt, candidates)
+
+    def begin_step(self, dt):
+        with self.timer.phase('integration'):
+            self.integrate(dt)
+
+            if self.held_index >= 0:
+                self.pos[self.held_index] = self.held_position
+
+        if self.contacts is not None and self.solver is None:
+            with self.timer.phase('warm_start'):
+                self.contacts.warm_start(self)
+
+    def solve_pass(self, tolerance=None):
+        """
+        One pass of pushing overlapping balls apart and back inside the walls. Returns the candidate pairs and, if
+        a tolerance is given, the deepest overlap the pass found (between balls or into a wall) before pushing;
+        overlaps between balls are only pushed apart if one of them is deeper than the tolerance.
+        """
+        with self.timer.phase('broad_phase'):
+            candidates = self.candidate_pairs()
+        self.timer.count('candidate_pairs', len(candidates[0]))
+        if self.solver is not None:
+            return candidates, self.solve_coloured(candidates, tolerance)
+        if self.contacts is not None:
+            return candidates, self.solve_cached(candidates, tolerance)
+        with self.timer.phase('narrow_phase'):
+            contacts = self.touching(*candidates)
+            deepest = self.deepest_overlap(*contacts) if tolerance is not None else None
+        self.timer.count('contacts', len(contacts[0]))
+        if self.asleep_count:
+            self.wake_touched(*contacts)
+        with self.timer.phase('response'):
+            if deepest is None or deepest > tolerance:
+                self.resolve_overlaps(*contacts)
+            return candidates, self.deepest_of(deepest, self.clamp_to_bounds())
+
+    def candidate_pairs(self):
+        if self.contacts is not None:
+            candidates = self.contacts.update(self)
+        else:
+            candidates = self.grid.update(self.pos)
+        if self.asleep_count and (self.contacts is None or self.solver is not None):
+            candidates = self.active_pairs(candidates)
+        return candidates
+
+    def end_step(self, dt, candidates=None):
+        """
+        Puts balls that have come to rest to sleep. Call it once per whole step, with the candidates from its last
+        pass if it had any.
+        """
+        if self.sleeping:
+            if candidates is None:
+                with self.timer.phase('broad_phase'):
+                    candidates = self.candidate_pairs()
+            self.update_sleep(dt, candidates)
+            self.timer.count('asleep', self.asleep_count)
+
+    def solve_cached(self, candidates, tolerance=None):
+        # the same as above, but the pushes are added up against each pair in the cache to warm start the next step
+        with self.timer.phase('narrow_phase'):
+            slots = self.contacts.touching(self)
+            a = candidates[0].take(slots)
+            b = candidates[1].take(slots)
+            deepest = self.deepest_overlap(a, b) if tolerance is not None else None
+        self.timer.count('contacts', len(slots))
+        if self.asleep_count:
+            self.wake_touched(a, b)
+        with self.timer.phase('response'):
+            if deepest is None or deepest > tolerance:
+                self.contacts.pushed[slots] += self.resolve_overlaps(a, b)
+            return self.deepest_of(deepest, self.clamp_to_bounds())
+
+    def solve_coloured(self, candidates, tolerance=None):
+        with self.timer.phase('narrow_phase'):
+            contacts = self.touching(*candidates)
+            if self.asleep_count:
+                self.wake_touched(*contacts)
+            deepest = self.deepest_overlap(*contacts) if tolerance is not None else None
+            # the touching pairs are new every pass, so they are coloured afresh every pass too. Colouring the
+            # candidates instead, which can last several passes, was tried: the contact cache is rebuilt most
+            # passes in a moving pile, and there are around three candidates to every contact to solve
+            if deepest is None or deepest > tolerance:
+                self.solver.prepare(self, contacts)
+        self.timer.count('contacts', len(contacts[0]))
+        with self.timer.phase('response'):
+            if deepest is None or deepest > tolerance:
+                self.solver.solve(self)
+            return self.deepest_of(deepest, self.clamp_to_bounds())
+
+    def deepest_overlap(self, a, b):
+        points = self.pos.view(np.complex128).ravel()
+        overlap = self.radius.take(a) + self.radius.take(b) - np.abs(points.take(b) - points.take(a))
+        return float(overlap.max(initial=0.0))
+
+    @staticmethod
+    def deepest_of(overlap, wall_overlap):
+        # only measured when asked for, so None stays None
+        if overlap is None:
+            return None
+        return max(overlap, wall_overlap)
+
+    def integrate(self, dt):
+        # Verlet integration, written into the spare buffer and then swapped round so nothing is allocated
+        np.multiply(self.pos, 2.0, out=self._next_pos)
+        self._next_pos -= self.prev_pos
+        self._next_pos += self.gravity * (dt * dt)
+        self.prev_pos, self.pos, self._next_pos = self.pos, self._next_pos, self.prev_pos
+        if self.asleep_count:
+            # sleeping balls stay exactly where they are
+            np.copyto(self.pos, self.prev_pos, where=~self.awake[:, None])
+
+    def update_sleep(self, dt, candidates):
+        moved = self.pos - self.prev_pos
+        slow = np.hypot(moved[:, 0], moved[:, 1]) < SLEEP_SPEED * dt
+        self.still_steps += 1
+        self.still_steps[~slow] = 0
+        self.steps_since_check += 1
+        if self.steps_since_check < ISLAND_CHECK_STEPS:
+            return
+        self.steps_since_check = 0
+        tired = self.awake & (self.still_steps >= SLEEP_STEPS)
+        if self.held_index >= 0:
+            tired[self.held_index] = False
+        if not tired.any():
+            return
+
+        # only islands where every ball is tired go to sleep
+        islands = self.islands(*candidates)
+        restless = np.bincount(islands, self.awake & ~tired, len(islands))
+        sleepy = tired & (restless.take(islands) == 0)
+        if not sleepy.any():
+            return
+
+        self.awake[sleepy] = False
+        self.island[sleepy] = islands[sleepy]
+        self.prev_pos[sleepy] = self.pos[sleepy]
+        self.asleep_count += int(np.count_nonzero(sleepy))
+        self._active_pairs = None
+
+    def islands(self, a, b):
+        """
+        Labels every ball with the lowest index in its group of touching awake balls.
+        """
+        points = self.pos.view(np.complex128).ravel()
+        near = np.abs(points.take(b) - points.take(a)) <= self.radius.take(a) + self.radius.take(b) + ISLAND_MARGIN
+        near &= self.awake.take(a) & self.awake.take(b)
+        a = a[near]
+        b = b[near]
+
+        # spread the lowest label across each touching pair until nothing changes, jumping labels to their own
+        # label each time round so long chains settle in a handful of passes
+        labels = np.arange(len(self.radius))
+        while True:
+            lowest = np.minimum(labels.take(a), labels.take(b))
+            before = labels.copy()
+            np.minimum.at(labels, a, lowest)
+            np.minimum.at(labels, b, lowest)
+            labels = labels.take(labels)
+            if np.array_equal(labels, before):
+                return labels
+
+    def active_pairs(self, candidates):
+        if self._active_pairs is None or self._active_source is not candidates:
+            a, b = candidates
+            active = self.awake.take(a) | self.awake.take(b)
+            self._active_pairs = (a[active], b[active])
+            self._active_source = candidates
+        return self._active_pairs
+
+    def wake_touched(self, a, b):
+        # anything awake touching a sleeper wakes its island
+        a_awake = self.awake.take(a)
+        b_awake = self.awake.take(b)
+        woken = np.concatenate((b[a_awake & ~b_awake], a[b_awake & ~a_awake]))
+        if len(woken):
+            self.wake(np.unique(woken))
+
+    def collisions(self):
+        """
+        Finds every overlapping pair of balls, returned as two arrays of indices.
+        """
+        return self.touching(*self.grid.update(self.pos))
+
+    def touching(self, a, b):
+        # viewing each (x, y) row as one complex number lets a single take() pull out whole positions, which is a
+        # lot quicker than fancy indexing into the (n, 2) array
+        points = self.pos.view(np.complex128).ravel()
+        distances = np.abs(points.take(b) - points.take(a))
+        touching = distances <= self.radius.take(a) + self.radius.take(b)
+        return a[touching], b[touching]
+
+    def resolve_overlaps(self, a, b, amounts=None):
+        """
+        Pushes each pair apart by stiffness times their overlap, or by amounts if given, split between the two
+        balls by mass. Returns how far each pair was pushed.
+        """
+        if len(a) == 0:
+            return np.zeros(0)
+
+        points = self.pos.view(np.complex128).ravel()
+        a2b = points.take(b) - points.take(a)
+        distances = np.abs(a2b)
+        if amounts is None:
+            amounts = self.stiffness * ((self.radius.take(a) + self.radius.take(b)) - distances)
+
+        # balls sitting exactly on top of each other have no direction to be pushed apart in, so pick one
+        coincident = distances == 0.0
+        distances[coincident] = 1.0
+        a2b[coincident] = 1.0
+        a2b /= distances
+
+        a_mass = self.mass.take(a)
+        b_mass = self.mass.take(b)
+        push = amounts / (a_mass + b_mass)
+        a_push = a2b * (push * b_mass)
+        b_push = a2b * (push * a_mass)
+
+        # bincount sums up every push on a ball, however many other balls it is touching
+        count = len(self.radius)
+        self.pos[:, 0] += np.bincount(b, b_push.real, count) - np.bincount(a, a_push.real, count)
+        self.pos[:, 1] += np.bincount(b, b_push.imag, count) - np.bincount(a, a_push.imag, count)
+        return amounts
+
+    def clamp_to_bounds(self):
+        """
+        Eases balls that have gone through a wall back inside. Returns how far the furthest of them had gone.
+        """
+        clamped = np.empty_like(self.pos)
+        np.clip(self.pos[:, 0], self.radius, self.width - self.radius, out=clamped[:, 0])
+        np.clip(self.pos[:, 1], self.radius, self.height - self.radius, out=clamped[:, 1])
+
+        outside = np.flatnonzero(np.any(clamped != self.pos, axis=1))
+        if len(outside) == 0:
+            return 0.0
+
+        depth = float(np.abs(clamped[outside] - self.pos[outside]).max())
+        self.pos[outside] = mix(self.pos[outside], clamped[outside], self.stiffness)
+        # damping
+        self.prev_pos[outside] = mix(self.prev_pos[outside], self.pos[outside], 0.001)
+        return depth
+
+
+def mix(a_val, b_val, amount):
+    return (1 - amount) * a_val + amount * b_val
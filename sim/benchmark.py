@@ -0,0 +1,234 @@
+import sys
+import math
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+import numpy as np
+import pygame
+
+from game.bat import Bat, ControlScheme
+from game.world import BounceWorld
+from game.renderer import StampCache
+from pit.world import PitWorld
+from sim.profiling import PhaseTimer
+from ball import Ball
+import physics_ball_pit
+
+"""
+A benchmark suite for both simulations.
+
+Every scene is built from a fixed seed so runs are comparable, stepped a fixed number of times with the world's
+phase timer switched on, and drawn to an off-screen surface after every step so rendering shows up as a phase of
+its own. Peak memory is measured in a separate, shorter run under tracemalloc, so the tracing doesn't skew the
+timings. Results can be saved as JSON and later runs compared against them, which exits with an error if any scene
+has slowed down by more than the tolerance.
+
+    python -m sim.benchmark --save baseline.json
+    python -m sim.benchmark --compare baseline.json --tolerance 0.15
+"""
+
+SIZES = (1, 100, 1000, 10000, 50000)
+BAT_COUNTS = (1, 4, 16)
+MEMORY_STEPS = 3
+
+
+class Scene:
+    def __init__(self, name, simulation, bodies, build, step, render):
+        self.name = name
+        self.simulation = simulation
+        self.bodies = bodies
+        self.build = build
+        self.step = step
+        self.render = render
+
+
+def bounce_scene(balls, bats=1, rotating=False, seed=0):
+    def build():
+        world = BounceWorld.default(seed=seed)
+        rng = world.rng
+        world.bats = []
+        for i in range(bats):
+            x = 400 if bats == 1 else 80 + (640 * i / (bats - 1))
+            bat = Bat((x, 500 - 60 * (i % 4)), ControlScheme())
+            bat.rotate_left = rotating
+            world.bats.append(bat)
+        world.balls = [Ball((rng.randint(30, 770), rng.randint(30, 570)), (255, 255, 255, 255), rng)
+                       for _ in range(balls)]
+        return world
+
+    def step(world, dt):
+        world.step(dt)
+
+    name = 'bounce-{}-balls-{}-bats{}'.format(balls, bats, '-rotating' if rotating else '')
+    return Scene(name, 'bounce', balls + bats, build, step, render_bounce)
+
+
+def pit_scene(balls, seed=0, iterations=5):
+    def build():
+        if balls <= 30:
+            return PitWorld.random(balls, physics_ball_pit.W, physics_ball_pit.H, physics_ball_pit.MIN_RADIUS,
+                                   physics_ball_pit.MAX_RADIUS, seed=seed, gravity=physics_ball_pit.GRAVITY)
+        # bigger pits get smaller balls and a box that leaves them about half the floor space
+        min_radius, max_radius = 4.0, 12.0
+        side = math.sqrt(balls * math.pi * 64.0 * 2.0)
+        return PitWorld.random(balls, side * 4 / 3, side, min_radius, max_radius, seed=seed)
+
+    def step(world, dt):
+        world.step(dt, iterations)
+
+    # drawn the way the game draws it, from stamps over the benchmark's black background
+    stamps = StampCache(background=(0, 0, 0))
+    ball_stamps = {}
+
+    def render(screen, world):
+        if world not in ball_stamps:
+            ball_stamps.clear()
+            ball_stamps[world] = physics_ball_pit.world_stamps(world, stamps)
+        screen.blits(physics_ball_pit.world_sprites(world, ball_stamps[world]), False)
+
+    return Scene('pit-{}-balls'.format(balls), 'pit', balls, build, step, render)
+
+
+def render_bounce(screen, world):
+    world.render_static(screen)
+    screen.blits(world.sprites(BOUNCE_STAMPS), False)
+
+
+BOUNCE_STAMPS = StampCache()
+
+
+def default_suite(sizes=SIZES, bat_counts=BAT_COUNTS):
+    scenes = []
+    for balls in sizes:
+        scenes.append(bounce_scene(balls))
+    # more bats, with and without them spinning, at a middling number of balls
+    for bats in bat_counts:
+        for rotating in (False, True):
+            if bats != 1 or rotating:
+                scenes.append(bounce_scene(min(1000, max(sizes)), bats, rotating))
+    for balls in sizes:
+        scenes.append(pit_scene(balls))
+    return scenes
+
+
+def run_scene(scene, steps, dt=1 / 60, render=True, memory=True):
+    world = scene.build()
+    timer = PhaseTimer()
+    world.timer = timer
+
+    screen = None
+    if render:
+        screen = pygame.Surface(screen_size(world))
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        scene.step(world, dt)
+        if screen is not None:
+            with timer.phase('render'):
+                screen.fill((0, 0, 0))
+                scene.render(screen, world)
+    seconds = time.perf_counter() - start
+
+    result = {'name': scene.name, 'simulation': scene.simulation, 'bodies': scene.bodies, 'steps': steps,
+              'seconds': seconds, 'steps_per_second': steps / seconds if seconds > 0 else float('inf'),
+              'phases': {name: totals['seconds'] / steps for name, totals in timer.summary().items()},
+              'counts': {name: count / steps for name, count in sorted(timer.counts.items())}}
+    if memory:
+        result['peak_memory'] = peak_memory(scene, dt)
+    return result
+
+
+def peak_memory(scene, dt):
+    tracemalloc.start()
+    try:
+        world = scene.build()
+        for _ in range(MEMORY_STEPS):
+            scene.step(world, dt)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def screen_size(world):
+    if isinstance(world, PitWorld):
+        return int(world.width), int(world.height)
+    return 800, 600
+
+
+def compare(results, baseline, tolerance):
+    """
+    Lines up results with a baseline by scene name and returns (name, ratio) for every scene that has got slower
+    by more than the tolerance, where ratio is the new steps per second over the baseline's.
+    """
+    previous = {result['name']: result for result in baseline['scenes']}
+    regressions = []
+    for result in results:
+        if result['name'] in previous:
+            ratio = result['steps_per_second'] / previous[result['name']]['steps_per_second']
+            result['baseline_ratio'] = ratio
+            if ratio < 1.0 - tolerance:
+                regressions.append((result['name'], ratio))
+    return regressions
+
+
+def environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'pygame': pygame.version.ver,
+            'machine': platform.machine(), 'processor': platform.processor()}
+
+
+def print_table(results):
+    phase_names = ['integration', 'broad_phase', 'narrow_phase', 'response', 'render']
+    header = '{:<42} {:>7} {:>11}'.format('scene', 'bodies', 'steps/s')
+    header += ''.join(' {:>12}'.format(name) for name in phase_names) + ' {:>9} {:>7}'.format('peak MB', 'vs base')
+    print(header)
+    for result in results:
+        line = '{:<42} {:>7} {:>11.1f}'.format(result['name'], result['bodies'], result['steps_per_second'])
+        line += ''.join(' {:>10.3f}ms'.format(result['phases'].get(name, 0.0) * 1000.0) for name in phase_names)
+        line += ' {:>9.1f}'.format(result.get('peak_memory', 0) / 2 ** 20)
+        if 'baseline_ratio' in result:
+            line += ' {:>6.2f}x'.format(result['baseline_ratio'])
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark both simulations over a range of scene sizes.')
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--bats', type=int, nargs='+', default=list(BAT_COUNTS))
+    parser.add_argument('--only', choices=['bounce', 'pit'], default=None)
+    parser.add_argument('--no-render', action='store_true')
+    parser.add_argument('--no-memory', action='store_true')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare against results saved earlier with --save')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='fraction of steps per second a scene may lose before it counts as a regression')
+    args = parser.parse_args()
+
+    scenes = [scene for scene in default_suite(args.sizes, args.bats)
+              if args.only is None or scene.simulation == args.only]
+    results = []
+    for scene in scenes:
+        results.append(run_scene(scene, args.steps, render=not args.no_render, memory=not args.no_memory))
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+
+    print_table(results)
+
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump({'environment': environment(), 'steps': args.steps, 'scenes': results}, results_file, indent=2)
+
+    if regressions:
+        for name, ratio in regressions:
+            print('REGRESSION: {} runs at {:.2f}x of the baseline'.format(name, ratio))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
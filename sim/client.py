@@ -0,0 +1,166 @@
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+from sim.recorder import RECORD
+from sim.server import (LENGTH, WORLD_ID, BAT_INPUT, SPAWN_INPUT, DRAG_INPUT, WORLD_ENTRY, FRAME_HEADER, DELTA_HEADER,
+                        SUBSCRIBE, UNSUBSCRIBE, BAT, SPAWN, DRAG, WORLDS, KEYFRAME, DELTA, ERROR, frame)
+
+"""
+The client end of sim.server: sends input and keeps a copy of the state of every world it is subscribed to.
+
+    client = await SimulationClient.connect(port=8765)
+    await client.subscribe(0)
+    while True:
+        world_id, tick = await client.receive()
+        bodies = client.states[world_id]
+
+Run on its own it is a load test, opening a lot of connections that all subscribe to every world and reporting how
+many ticks they saw. --slow makes some of them read slowly, to show the others don't notice.
+
+    python -m sim.client --port 8765 --subscribers 300 --seconds 10 --slow 20
+"""
+
+
+class SimulationClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.worlds = {}
+        self.states = {}
+        self.bats = {}
+        self.ticks = {}
+        self.keyframes = 0
+        self.deltas = 0
+        self.errors = []
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=8765, unix_path=None):
+        if unix_path is not None:
+            reader, writer = await asyncio.open_unix_connection(unix_path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        client = cls(reader, writer)
+        # the server always starts with the list of worlds
+        while not client.worlds:
+            await client.receive()
+        return client
+
+    async def send(self, payload):
+        self.writer.write(frame(payload))
+        await self.writer.drain()
+
+    async def subscribe(self, world_id):
+        await self.send(bytes((SUBSCRIBE,)) + WORLD_ID.pack(world_id))
+
+    async def unsubscribe(self, world_id):
+        await self.send(bytes((UNSUBSCRIBE,)) + WORLD_ID.pack(world_id))
+        self.states.pop(world_id, None)
+        self.ticks.pop(world_id, None)
+
+    async def steer(self, world_id, bat, flags):
+        # flags are the server's BAT_LEFT, BAT_RIGHT, BAT_ROTATE_LEFT and BAT_ROTATE_RIGHT or'd together
+        await self.send(bytes((BAT,)) + BAT_INPUT.pack(world_id, bat, flags))
+
+    async def spawn(self, world_id, position):
+        await self.send(bytes((SPAWN,)) + SPAWN_INPUT.pack(world_id, *position))
+
+    async def drag(self, world_id, phase, position):
+        await self.send(bytes((DRAG,)) + DRAG_INPUT.pack(world_id, phase, *position))
+
+    async def receive(self):
+        """
+        Reads one message and applies it. Returns (world id, tick) for state, or (None, None) for anything else.
+        """
+        length, = LENGTH.unpack(await self.reader.readexactly(LENGTH.size))
+        message = await self.reader.readexactly(length)
+        kind = message[0]
+
+        if kind == KEYFRAME:
+            _, world_id, tick, rows, bats = FRAME_HEADER.unpack_from(message)
+            self.states[world_id] = np.frombuffer(message, RECORD, rows, FRAME_HEADER.size).copy()
+            self.bats[world_id] = bats
+            self.ticks[world_id] = tick
+            self.keyframes += 1
+            return world_id, tick
+
+        if kind == DELTA:
+            _, world_id, tick, changed = DELTA_HEADER.unpack_from(message)
+            if self.ticks.get(world_id) != tick - 1:
+                # the server only sends deltas on top of the tick it sent last, so this can't happen
+                raise ValueError('delta for tick {} of world {} out of order'.format(tick, world_id))
+            rows = np.frombuffer(message, '<u4', changed, DELTA_HEADER.size)
+            self.states[world_id][rows] = np.frombuffer(message, RECORD, changed, DELTA_HEADER.size + rows.nbytes)
+            self.ticks[world_id] = tick
+            self.deltas += 1
+            return world_id, tick
+
+        if kind == WORLDS:
+            count, = WORLD_ID.unpack_from(message, 1)
+            for i in range(count):
+                world_id, world_kind, dt = WORLD_ENTRY.unpack_from(message, 1 + WORLD_ID.size + i * WORLD_ENTRY.size)
+                self.worlds[world_id] = (world_kind, dt)
+        elif kind == ERROR:
+            self.errors.append(message[1:].decode('utf-8'))
+        else:
+            raise ValueError('unknown message type {}'.format(kind))
+        return None, None
+
+    def close(self):
+        self.writer.close()
+
+
+async def load_test(host, port, unix_path, subscribers, seconds, slow, slow_delay):
+    clients = []
+    for _ in range(subscribers):
+        client = await SimulationClient.connect(host, port, unix_path)
+        for world_id in client.worlds:
+            await client.subscribe(world_id)
+        clients.append(client)
+
+    async def read(client, delay):
+        while True:
+            await client.receive()
+            if delay:
+                await asyncio.sleep(delay)
+
+    started = time.perf_counter()
+    tasks = [asyncio.ensure_future(read(client, slow_delay if i < slow else 0.0)) for i, client in enumerate(clients)]
+    await asyncio.sleep(seconds)
+    elapsed = time.perf_counter() - started
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for client in clients:
+        client.close()
+
+    worlds = max(len(client.worlds), 1)
+    for name, group in (('slow', clients[:slow]), ('keeping up', clients[slow:])):
+        if not group:
+            continue
+        rates = [(client.keyframes + client.deltas) / elapsed / worlds for client in group]
+        keyframes = sum(client.keyframes for client in group) / max(sum(client.keyframes + client.deltas
+                                                                         for client in group), 1)
+        print('{} {} clients: {:.1f} ticks a second per world (lowest {:.1f}), {:.1%} of them keyframes'.format(
+            len(group), name, sum(rates) / len(rates), min(rates), keyframes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test a simulation server with many subscribers.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='connect to this unix socket instead')
+    parser.add_argument('--subscribers', type=int, default=100)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--slow', type=int, default=0, help='how many of the subscribers read slowly')
+    parser.add_argument('--slow-delay', type=float, default=0.2, help='how long a slow subscriber waits between reads')
+    args = parser.parse_args()
+
+    asyncio.run(load_test(args.host, args.port, args.unix, args.subscribers, args.seconds, args.slow,
+                          args.slow_delay))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+A fixed time step clock for running physics at a steady rate whatever the frame rate.
+
+Every frame the time since the last one is added to an accumulator, and the simulation is stepped with the same
+fixed dt for as many whole steps as that holds. When drawing is slow several steps run for each frame drawn; when
+it is fast some frames run none and just redraw. What's left over in the accumulator says how far the real time is
+between the last two steps, so drawing can blend the previous and current positions by that fraction (alpha) and
+motion stays smooth even when the frame rate and step rate don't line up.
+
+If a frame takes so long that catching up would need more than max_steps steps, the extra time is dropped, so a
+stall slows the simulation down for a moment rather than making every following frame slower still.
+
+    clock = FixedStepClock(1 / 60)
+    while running:
+        for _ in range(clock.advance(frame_time)):
+            world.step(clock.step)
+        draw(world, clock.alpha)
+
+A lockstep clock ignores the real time altogether and runs exactly one step for every frame. The simulation then goes
+at whatever speed the frames are drawn at, but every input lands on the same step on every run, so a seeded world
+driven by the same inputs plays out exactly the same way each time.
+"""
+
+
+class FixedStepClock:
+    def __init__(self, step=1 / 60, max_steps=5, lockstep=False):
+        self.step = step
+        self.max_steps = max_steps
+        self.lockstep = lockstep
+        self.accumulator = 0.0
+        self.steps = 0
+        self.dropped_time = 0.0
+
+    def advance(self, frame_time):
+        """
+        Adds frame_time seconds and returns how many fixed steps to run for it.
+        """
+        if self.lockstep:
+            self.steps += 1
+            return 1
+
+        self.accumulator += frame_time
+        steps = int(self.accumulator / self.step)
+        if steps > self.max_steps:
+            # keep the part of a step that's left over so alpha still makes sense, and give up on the rest
+            left_over = self.accumulator - steps * self.step
+            self.dropped_time += (steps - self.max_steps) * self.step
+            self.accumulator = left_over + self.max_steps * self.step
+            steps = self.max_steps
+
+        self.accumulator -= steps * self.step
+        self.steps += steps
+        return steps
+
+    @property
+    def alpha(self):
+        # how far between the previous step and the latest one the real time has got to, from 0 to 1
+        if self.lockstep:
+            return 1.0
+        return min(1.0, self.accumulator / self.step)
@@ -0,0 +1,289 @@
+import sys
+import hashlib
+import argparse
+
+import numpy as np
+
+from game.world import BounceWorld
+from pit.solver import ColouredSolver
+from pit.world import PitWorld
+from sim.headless import default_pit
+from sim.scene import load_scene, check_kind
+
+"""
+Checks that a simulation plays out exactly the same way from run to run, and from one build of the code to another.
+
+Both worlds are deterministic given their starting state: a BounceWorld draws its random numbers from its own seeded
+random.Random, and everything is updated in a fixed order - balls in list order, each against its walls in the order
+the walls were given (WallIndex.query sorts them) and the bats in list order; pit pairs in the order the grid hands
+them out, with the coloured solver giving the same answer however many threads it runs on. So two runs from the same
+seed with the same dt should agree to the last bit, and this is how that gets checked.
+
+After every step the world's physical state - where everything is and how fast it is going - is folded into a
+running hash, so one digest covers every step up to that point and a difference in any of them shows up. The digest
+and the state itself are kept every so many steps as checkpoints. A run's checkpoints can be saved and a later run
+(of another build, or an optimised backend) compared against them: matching digests mean the runs were bit identical
+all the way through, and where they don't match the saved states say how far apart they had got, which may still be
+within a tolerance.
+
+    python -m sim.determinism bounce --seed 1 --steps 1000000 --every 10000 --save bounce.npz
+    python -m sim.determinism bounce --seed 1 --steps 1000000 --every 10000 --expect bounce.npz
+
+    python -m sim.determinism pit --seed 1 --balls 2000 --steps 5000 --save pit.npz
+    python -m sim.determinism pit --seed 1 --balls 2000 --steps 5000 --threads 4 --expect pit.npz
+
+    python -m sim.determinism engines --seed 1 --balls 30 --steps 600 --tolerance 0.001
+"""
+
+DIGEST_SIZE = 16
+
+
+def physical_state(world):
+    """
+    The state that matters to anyone watching, as a float64 array with one row per body. For a BounceWorld the bats
+    come first as (x, y, previous x, previous y, rotation) and then the balls as (x, y, velocity x, velocity y,
+    bounces); for a PitWorld each ball is (x, y, previous x, previous y), the previous position standing in for
+    its velocity. A list of physics_ball_pit.Ball objects - the original pit, stepped by step_balls - gives the same
+    rows as a PitWorld, so the two pits can be compared.
+    """
+    if isinstance(world, PitWorld):
+        return np.concatenate((world.pos, world.prev_pos), axis=1)
+    if isinstance(world, list):
+        return object_pit_state(world)
+    if not isinstance(world, BounceWorld):
+        raise TypeError('no physical state for {}'.format(type(world).__name__))
+    values = []
+    for bat in world.bats:
+        values += bat.position
+        values += bat.previous_position
+        values.append(bat.rotation)
+    for ball in world.balls:
+        values += ball.position
+        values += ball.velocity
+        values.append(ball.number_of_bounces)
+    return np.array(values, dtype=np.float64).reshape(-1, 5)
+
+
+def object_pit_state(balls):
+    return np.array([(ball.pos.x, ball.pos.y, ball.prev_pos.x, ball.prev_pos.y) for ball in balls],
+                    dtype=np.float64).reshape(-1, 4)
+
+
+def state_hash(world):
+    return hashlib.blake2b(physical_state(world).tobytes(), digest_size=DIGEST_SIZE).hexdigest()
+
+
+class StepHasher:
+    """
+    Folds the world's state into a running digest after every step, keeping the digest and state every so many
+    steps.
+    """
+    def __init__(self, every=1000):
+        self.every = every
+        self.digest = bytes(DIGEST_SIZE)
+        self.steps = 0
+        self.checkpoints = []
+        self.digests = []
+        self.states = []
+
+    def update(self, world):
+        state = physical_state(world)
+        # the shape goes in too, so a ball appearing or disappearing can't go unnoticed
+        self.digest = hashlib.blake2b(self.digest + np.array(state.shape, dtype='<i8').tobytes() + state.tobytes(),
+                                      digest_size=DIGEST_SIZE).digest()
+        self.steps += 1
+        if self.steps % self.every == 0:
+            self.checkpoint(state)
+
+    def checkpoint(self, state):
+        self.checkpoints.append(self.steps)
+        self.digests.append(self.digest)
+        self.states.append(state)
+
+    def finish(self, world):
+        # the last step is always kept, whether or not it lands on a checkpoint
+        if not self.checkpoints or self.checkpoints[-1] != self.steps:
+            self.checkpoint(physical_state(world))
+
+    @property
+    def hexdigest(self):
+        return self.digest.hex()
+
+    def save(self, path):
+        # the states are stacked into one array, with how many rows each had to split them up again
+        columns = self.states[0].shape[1] if self.states else 0
+        np.savez(path, checkpoints=np.array(self.checkpoints, dtype=np.int64),
+                 digests=np.frombuffer(b''.join(self.digests), dtype=np.uint8).reshape(-1, DIGEST_SIZE),
+                 rows=np.array([len(state) for state in self.states], dtype=np.int64),
+                 states=np.concatenate(self.states) if self.states else np.zeros((0, columns)))
+
+
+def load_checkpoints(path):
+    """
+    The (checkpoints, digests, states) saved by StepHasher.save.
+    """
+    with np.load(path) as saved:
+        states = np.split(saved['states'], np.cumsum(saved['rows'])[:-1])
+        return saved['checkpoints'].tolist(), [digest.tobytes() for digest in saved['digests']], states
+
+
+def compare_checkpoints(hasher, expected, tolerance=0.0):
+    """
+    Lines a run's checkpoints up against expected ones (as returned by load_checkpoints). Returns a list of
+    (step, identical, difference) for every checkpoint they share, difference being the largest gap between any
+    two matching numbers in the states (infinite if the states aren't even the same shape), and whether every
+    checkpoint was bit identical or within tolerance.
+    """
+    expected = {step: (digest, state) for step, digest, state in zip(*expected)}
+    results = []
+    passed = True
+    for step, digest, state in zip(hasher.checkpoints, hasher.digests, hasher.states):
+        if step not in expected:
+            continue
+        expected_digest, expected_state = expected[step]
+        difference = state_difference(state, expected_state)
+        identical = digest == expected_digest
+        results.append((step, identical, difference))
+        if not identical and not difference <= tolerance:
+            passed = False
+    return results, passed
+
+
+def state_difference(a, b):
+    if a.shape != b.shape:
+        return float('inf')
+    if len(a) == 0:
+        return 0.0
+    difference = np.abs(a - b)
+    # a NaN on one side only is as far apart as it gets, NaN on both sides is the same
+    difference[np.isnan(a) != np.isnan(b)] = np.inf
+    difference[np.isnan(a) & np.isnan(b)] = 0.0
+    return float(difference.max())
+
+
+def first_divergence(world_a, world_b, steps, step_a, step_b, tolerance=0.0):
+    """
+    Steps two worlds side by side, calling step_a(world_a) and step_b(world_b) each time, and returns the first
+    step after which their states differ by more than tolerance along with how far apart they were, or None if
+    they never do. This is the check for two backends in the same process.
+
+    Either world can be anything physical_state understands, and the two are comparable when they give the same
+    rows: two BounceWorlds, or any two of a PitWorld and a list of the original pit's Ball objects (see
+    compare_pit_engines). A BounceWorld against a pit always differs at the first step.
+    """
+    for step in range(1, steps + 1):
+        step_a(world_a)
+        step_b(world_b)
+        difference = state_difference(physical_state(world_a), physical_state(world_b))
+        if not difference <= tolerance:
+            return step, difference
+    return None
+
+
+def compare_pit_engines(count=30, seed=0, steps=600, dt=1 / 60, iterations=5, tolerance=1e-6):
+    """
+    Runs the original pit - physics_ball_pit's Ball objects stepped by step_balls - and a PitWorld from the same
+    starting balls side by side, with first_divergence. The PitWorld has sleeping and the contact cache turned off,
+    as the original has neither. The original pushes overlapping pairs apart one after another and the PitWorld
+    all at once, so they are not expected to stay bit identical; this says how long they stay within tolerance.
+    """
+    # the original pit is built on pygame's Vector2, so this is the one place here that needs pygame
+    import physics_ball_pit
+
+    balls = physics_ball_pit.make_balls(count, seed)
+    world = PitWorld(physics_ball_pit.W, physics_ball_pit.H, [(ball.pos.x, ball.pos.y) for ball in balls],
+                     [ball.radius for ball in balls], gravity=physics_ball_pit.GRAVITY,
+                     stiffness=physics_ball_pit.STIFFNESS, sleeping=False, contact_cache=False)
+    return first_divergence(balls, world, steps,
+                            lambda objects: physics_ball_pit.step_balls(objects, dt, iterations),
+                            lambda arrays: arrays.step(dt, iterations), tolerance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hash every step of a seeded run, to check runs are reproducible.')
+    parser.add_argument('simulation', choices=['bounce', 'pit', 'engines'],
+                        help='engines steps the original object pit and PitWorld side by side')
+    parser.add_argument('--steps', type=int, default=10000)
+    parser.add_argument('--dt', type=float, default=1 / 60)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--balls', type=int, default=30, help='number of balls in the pit')
+    parser.add_argument('--iterations', type=int, default=5, help='constraint iterations per pit step')
+    parser.add_argument('--threads', type=int, default=0,
+                        help='resolve pit overlaps with the graph-coloured solver on this many threads')
+    parser.add_argument('--continuous', action='store_true',
+                        help='sweep bounce balls along their moves so big steps do not tunnel')
+    parser.add_argument('--square-balls', action='store_true',
+                        help='collide bounce balls as boxes, the way they were before they were round')
+    parser.add_argument('--scene', help='start from this scene file instead of the default layout')
+    parser.add_argument('--every', type=int, default=1000, help='keep a checkpoint every this many steps')
+    parser.add_argument('--save', help='save the checkpoints to this .npz file')
+    parser.add_argument('--expect', help='compare against checkpoints saved earlier with --save')
+    parser.add_argument('--tolerance', type=float, default=0.0,
+                        help='how far states that are not bit identical may drift before the check fails')
+    args = parser.parse_args()
+
+    if args.scene and args.simulation != 'engines':
+        try:
+            check_kind(args.scene, args.simulation)
+        except ValueError as error:
+            parser.error(str(error))
+
+    if args.simulation == 'engines':
+        divergence = compare_pit_engines(args.balls, args.seed, args.steps, args.dt, args.iterations,
+                                         args.tolerance)
+        if divergence is None:
+            print('Within {:g} of each other for all {} steps'.format(args.tolerance, args.steps))
+        else:
+            print('Further apart than {:g} after step {} (difference {:.3g})'.format(args.tolerance, *divergence))
+        return
+
+    solver = ColouredSolver(args.threads) if args.threads else None
+    try:
+        if args.simulation == 'bounce':
+            if args.scene:
+                world = load_scene(args.scene, 'bounce', continuous_collision=args.continuous, seed=args.seed,
+                                   round_balls=not args.square_balls)
+            else:
+                world = BounceWorld.default(continuous_collision=args.continuous, seed=args.seed,
+                                            round_balls=not args.square_balls)
+        else:
+            if args.scene:
+                world = load_scene(args.scene, 'pit', solver=solver)
+            else:
+                world = default_pit(args.balls, args.seed, solver)
+
+        hasher = StepHasher(args.every)
+        for _ in range(args.steps):
+            if args.simulation == 'bounce':
+                world.step(args.dt)
+            else:
+                world.step(args.dt, args.iterations)
+            hasher.update(world)
+        hasher.finish(world)
+    finally:
+        if solver is not None:
+            solver.close()
+
+    print('{} steps, final digest {}'.format(hasher.steps, hasher.hexdigest))
+    if args.save:
+        hasher.save(args.save)
+
+    if args.expect:
+        results, passed = compare_checkpoints(hasher, load_checkpoints(args.expect), args.tolerance)
+        if not results:
+            print('No checkpoints in common with', args.expect)
+            sys.exit(1)
+        diverged = [(step, difference) for step, identical, difference in results if not identical]
+        if not diverged:
+            print('Bit identical at all {} checkpoints'.format(len(results)))
+        else:
+            step, difference = diverged[0]
+            print('First differs by step {} (difference there {:.3g})'.format(step, difference))
+            print('Largest difference at any checkpoint: {:.3g}'.format(max(difference for _, difference in diverged)))
+        if not passed:
+            print('FAILED: outside the tolerance of {:g}'.format(args.tolerance))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import time
+import argparse
+
+from game.world import BounceWorld
+from pit.adaptive import AdaptiveSteps
+from pit.solver import ColouredSolver
+from pit.world import PitWorld
+from sim.recorder import TrajectoryRecorder
+from sim.scene import load_scene, check_kind
+
+"""
+Runs the simulations without a window.
+
+Nothing here imports pygame at all - the worlds are just stepped with a fixed dt as fast as they will go, which is
+what you want when generating trajectories in bulk on a server. (The physics only needs pygame once something is
+drawn, so it is imported inside the render methods rather than at the top of each module.)
+
+    python -m sim.headless bounce --steps 100000
+    python -m sim.headless pit --balls 5000 --steps 1000
+"""
+
+
+class HeadlessResult:
+    def __init__(self, world, steps, seconds):
+        self.world = world
+        self.steps = steps
+        self.seconds = seconds
+
+    @property
+    def steps_per_second(self):
+        if self.seconds <= 0.0:
+            return float('inf')
+        return self.steps / self.seconds
+
+    def __repr__(self):
+        return 'HeadlessResult(steps={}, seconds={:.3f}, steps_per_second={:.1f})'.format(self.steps, self.seconds,
+                                                                                      self.steps_per_second)
+
+
+def default_pit(count=30, seed=None, solver=None, adaptive=None):
+    return PitWorld.default(count, seed, solver=solver, adaptive=adaptive)
+
+
+def run_bounce(world=None, steps=10000, dt=1 / 60, controller=None, recorder=None):
+    """
+    Steps a BounceWorld (the default game layout if none is given) a fixed number of times. If a controller is
+    passed it is called as controller(world, step) before every step, which is the place to steer the bats. A
+    TrajectoryRecorder, if given, is handed the world after every step.
+    """
+    if world is None:
+        world = BounceWorld.default()
+
+    start = time.perf_counter()
+    for step in range(steps):
+        if controller is not None:
+            controller(world, step)
+        world.step(dt)
+        if recorder is not None:
+            recorder.record(world, step, dt)
+    return HeadlessResult(world, steps, time.perf_counter() - start)
+
+
+def run_pit(world=None, steps=1000, dt=1 / 60, iterations=5, recorder=None):
+    if world is None:
+        world = default_pit()
+
+    start = time.perf_counter()
+    for step in range(steps):
+        world.step(dt, iterations)
+        if recorder is not None:
+            recorder.record(world, step, dt)
+    return HeadlessResult(world, steps, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a simulation headless with a fixed time step.')
+    parser.add_argument('simulation', choices=['bounce', 'pit'])
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--dt', type=float, default=1 / 60)
+    parser.add_argument('--balls', type=int, default=30, help='number of balls in the pit')
+    parser.add_argument('--iterations', type=int, default=5, help='constraint iterations per pit step')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--threads', type=int, default=0,
+                        help='resolve pit overlaps with the graph-coloured solver on this many threads')
+    parser.add_argument('--continuous', action='store_true',
+                        help='sweep bounce balls along their moves so big steps do not tunnel')
+    parser.add_argument('--square-balls', action='store_true',
+                        help='collide bounce balls as boxes, the way they were before they were round')
+    parser.add_argument('--record', help='write every step of the run to this trajectory file')
+    parser.add_argument('--scene', help='start from this scene file instead of the default layout')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='give each pit step as many constraint passes and substeps as it needs, not --iterations')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='with --adaptive, milliseconds a pit step can use before it stops doing extra')
+    args = parser.parse_args()
+
+    if args.scene:
+        try:
+            check_kind(args.scene, args.simulation)
+        except ValueError as error:
+            parser.error(str(error))
+
+    recorder = TrajectoryRecorder(args.record) if args.record else None
+    solver = ColouredSolver(args.threads) if args.threads else None
+    try:
+        if args.simulation == 'bounce':
+            if args.scene:
+                world = load_scene(args.scene, 'bounce', continuous_collision=args.continuous, seed=args.seed,
+                                   round_balls=not args.square_balls)
+            else:
+                world = BounceWorld.default(continuous_collision=args.continuous, seed=args.seed,
+                                            round_balls=not args.square_balls)
+            result = run_bounce(world, steps=args.steps, dt=args.dt, recorder=recorder)
+            print(result)
+            print('Bounces:', result.world.total_bounces())
+        else:
+            adaptive = None
+            if args.adaptive:
+                adaptive = AdaptiveSteps(budget=args.budget / 1000.0 if args.budget is not None else None)
+            if args.scene:
+                world = load_scene(args.scene, 'pit', solver=solver, adaptive=adaptive)
+            else:
+                world = default_pit(args.balls, args.seed, solver, adaptive)
+            result = run_pit(world, steps=args.steps, dt=args.dt, iterations=args.iterations, recorder=recorder)
+            print(result)
+            if adaptive is not None:
+                print('Adaptive steps:', adaptive.summary())
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if solver is not None:
+            solver.close()
+
+
+if __name__ == '__main__':
+    main()
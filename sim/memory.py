@@ -0,0 +1,39 @@
+import random
+import argparse
+import tracemalloc
+
+from ball import Ball
+
+"""
+Measures how much memory each Ball costs, so changes to its layout can be checked.
+
+    python -m sim.memory --balls 100000
+"""
+
+
+def bytes_per_ball(count=10000, seed=0):
+    rng = random.Random(seed)
+    starts = [(rng.randint(20, 780), rng.randint(20, 580)) for _ in range(count)]
+    colour = (255, 255, 255, 255)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        balls = [Ball(start, colour) for start in starts]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    # the list holding the balls isn't part of any one ball
+    return (after - before - balls.__sizeof__()) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the memory used per Ball.')
+    parser.add_argument('--balls', type=int, default=10000)
+    args = parser.parse_args()
+    print('{:.0f} bytes per ball'.format(bytes_per_ball(args.balls)))
+
+
+if __name__ == '__main__':
+    main()
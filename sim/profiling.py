@@ -0,0 +1,135 @@
+import time
+import json
+from collections import defaultdict
+
+"""
+Timing and counters for the separate phases of a simulation step.
+
+Worlds hold a timer and wrap each phase of their step in 'with self.timer.phase(name):', and bump counters (pairs
+tested, contacts found and so on) with 'self.timer.count(name, amount)'. By default that timer is NULL_TIMER, whose
+phase() hands back one shared do-nothing context manager and whose count() does nothing, so leaving profiling off
+costs next to nothing.
+
+A PhaseTimer keeps running totals, the figures for the last whole frame (for an on-screen overlay) and, if asked
+to, a trace of every phase that can be saved in the Chrome trace event format and opened in chrome://tracing or
+Perfetto.
+"""
+
+
+class PhaseTimer:
+    enabled = True
+
+    def __init__(self, trace=False):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counts = defaultdict(int)
+        self.frames = 0
+
+        self.frame_totals = defaultdict(float)
+        self.frame_counts = defaultdict(int)
+        self.last_frame = {}
+        self.last_frame_counts = {}
+
+        self.trace = trace
+        self.events = []
+        self.started = time.perf_counter()
+
+    def phase(self, name):
+        return TimedPhase(self, name)
+
+    def count(self, name, amount=1):
+        self.counts[name] += amount
+        self.frame_counts[name] += amount
+
+    def record(self, name, start, end):
+        duration = end - start
+        self.totals[name] += duration
+        self.calls[name] += 1
+        self.frame_totals[name] += duration
+        if self.trace:
+            self.events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                                'ts': (start - self.started) * 1e6, 'dur': duration * 1e6})
+
+    def frame(self):
+        """
+        Marks the end of a frame, moving this frame's figures over to last_frame and last_frame_counts.
+        """
+        self.frames += 1
+        self.last_frame = dict(self.frame_totals)
+        self.last_frame_counts = dict(self.frame_counts)
+        self.frame_totals.clear()
+        self.frame_counts.clear()
+        if self.trace:
+            self.events.append({'name': 'counts', 'ph': 'C', 'pid': 0, 'tid': 0,
+                                'ts': (time.perf_counter() - self.started) * 1e6, 'args': self.last_frame_counts})
+
+    def reset(self):
+        self.totals.clear()
+        self.calls.clear()
+        self.counts.clear()
+        self.frame_totals.clear()
+        self.frame_counts.clear()
+        self.last_frame = {}
+        self.last_frame_counts = {}
+        self.frames = 0
+        self.events = []
+
+    def summary(self):
+        return {name: {'seconds': self.totals[name], 'calls': self.calls[name]} for name in sorted(self.totals)}
+
+    def export_chrome_trace(self, path):
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, trace_file)
+
+
+class TimedPhase:
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullTimer:
+    # lets callers skip working out counts that nobody is going to look at
+    enabled = False
+    _phase = NullPhase()
+    last_frame = {}
+    last_frame_counts = {}
+
+    def phase(self, name):
+        return self._phase
+
+    def count(self, name, amount=1):
+        pass
+
+    def frame(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def summary(self):
+        return {}
+
+
+NULL_TIMER = NullTimer()
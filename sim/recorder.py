@@ -0,0 +1,214 @@
+import mmap
+import queue
+import threading
+
+import numpy as np
+
+from pit.world import PitWorld
+
+"""
+Records where every ball and bat is at every step of a run, and reads those recordings back.
+
+Each step is written as one fixed width record per body - position, velocity and rotation as float32s - appended to
+a data file, plus one entry in an index file saying which step it was, where its records start and how many bodies
+there were (bats come first, then balls). Both files are filled through memory maps that are grown a chunk at a time,
+so a run of any length only ever holds one chunk of each in memory, and the writing is done on a background thread:
+the simulation only has to copy its state into an array and put it on a queue. If the disk can't keep up the queue
+fills and record() waits, rather than memory running out.
+
+TrajectoryReader maps the same files back in, so any step or run of steps can be sliced out without reading the
+rest of the file.
+
+    with TrajectoryRecorder('run.traj') as recorder:
+        for step in range(steps):
+            world.step(dt)
+            recorder.record(world, step, dt)
+
+    reader = TrajectoryReader('run.traj')
+    step, bats, bodies = reader.frame(1000)
+"""
+
+MAGIC = b'BPTRAJ01'
+CHUNK_BYTES = 16 * 2 ** 20
+QUEUE_SIZE = 256
+
+RECORD = np.dtype([('x', '<f4'), ('y', '<f4'), ('vx', '<f4'), ('vy', '<f4'), ('rotation', '<f4')])
+INDEX = np.dtype([('step', '<i8'), ('offset', '<i8'), ('count', '<i4'), ('bats', '<i4')])
+
+
+def index_path(path):
+    return path + '.index'
+
+
+def bounce_state(world, dt):
+    """
+    The bats then the balls of a BounceWorld as an (n, 5) float32 array, and how many of the rows are bats.
+    """
+    values = []
+    for bat in world.bats:
+        values += bat.position
+        values += ((bat.position[0] - bat.previous_position[0]) / dt, (bat.position[1] - bat.previous_position[1]) / dt,
+                   bat.rotation)
+    for ball in world.balls:
+        values += ball.position
+        values += ball.velocity
+        values.append(0.0)
+    return np.array(values, dtype=np.float32).reshape(-1, 5), len(world.bats)
+
+
+def pit_state(world, dt):
+    state = np.zeros((len(world), 5), dtype=np.float32)
+    state[:, 0:2] = world.pos
+    # Verlet bodies don't keep a velocity, but how far they moved over the last step gives it
+    state[:, 2:4] = (world.pos - world.prev_pos) / dt
+    return state, 0
+
+
+class MappedAppender:
+    """
+    A file that is only ever appended to, through a memory map of its last chunk_bytes. The file is grown a chunk
+    at a time and cut back to what was actually written when it is closed.
+    """
+    def __init__(self, path, chunk_bytes=CHUNK_BYTES):
+        if chunk_bytes % mmap.ALLOCATIONGRANULARITY:
+            raise ValueError('chunk_bytes must be a multiple of {}'.format(mmap.ALLOCATIONGRANULARITY))
+        self.file = open(path, 'w+b')
+        self.chunk_bytes = chunk_bytes
+        self.chunk = None
+        self.chunk_start = 0
+        self.length = 0
+
+    def append(self, data):
+        data = memoryview(data).cast('B')
+        while len(data):
+            if self.chunk is None or self.length == self.chunk_start + self.chunk_bytes:
+                self.next_chunk()
+            at = self.length - self.chunk_start
+            size = min(len(data), self.chunk_bytes - at)
+            self.chunk[at:at + size] = data[:size]
+            self.length += size
+            data = data[size:]
+
+    def next_chunk(self):
+        if self.chunk is not None:
+            self.chunk.close()
+        self.chunk_start = self.length
+        self.file.truncate(self.chunk_start + self.chunk_bytes)
+        self.chunk = mmap.mmap(self.file.fileno(), self.chunk_bytes, offset=self.chunk_start)
+
+    def close(self):
+        if self.chunk is not None:
+            self.chunk.flush()
+            self.chunk.close()
+            self.chunk = None
+        self.file.truncate(self.length)
+        self.file.close()
+
+
+class TrajectoryRecorder:
+    def __init__(self, path, chunk_bytes=CHUNK_BYTES, queue_size=QUEUE_SIZE):
+        self.path = path
+        self.data = MappedAppender(path, chunk_bytes)
+        self.index = MappedAppender(index_path(path), chunk_bytes)
+        self.data.append(MAGIC)
+        self.index.append(MAGIC)
+
+        self.records = 0
+        self.steps = 0
+        self.error = None
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self.write_loop, name='trajectory-writer', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def record(self, world, step, dt):
+        """
+        Queues the state of a BounceWorld or PitWorld after the given step. dt is the step's length, which the
+        velocities of bats and pit balls are worked out from.
+        """
+        if self.error is not None:
+            raise self.error
+        if isinstance(world, PitWorld):
+            state, bats = pit_state(world, dt)
+        else:
+            state, bats = bounce_state(world, dt)
+
+        entry = np.array([(step, self.records, len(state), bats)], dtype=INDEX)
+        self.records += len(state)
+        self.steps += 1
+        self.queue.put((state, entry))
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            state, entry = item
+            try:
+                self.data.append(state)
+                self.index.append(entry)
+            except Exception as error:
+                # raised again on the simulation's thread at the next record() or close()
+                self.error = error
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        self.data.close()
+        self.index.close()
+        if self.error is not None:
+            raise self.error
+
+
+class TrajectoryReader:
+    def __init__(self, path):
+        self.path = path
+        self.records = self.map(path, RECORD)
+        self.index = self.map(index_path(path), INDEX)
+
+    @staticmethod
+    def map(path, dtype):
+        with open(path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError('{} is not a trajectory recording'.format(path))
+            file.seek(0, 2)
+            count = (file.tell() - len(MAGIC)) // dtype.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', offset=len(MAGIC), shape=(count,))
+
+    def __len__(self):
+        return len(self.index)
+
+    def frame(self, number):
+        """
+        The step number, bat count and (bodies, 5) array of records for the number'th recorded step. The array is
+        a view onto the file, so copy it to keep it past the reader's life.
+        """
+        step, offset, count, bats = self.index[number].tolist()
+        return step, bats, self.records[offset:offset + count].view(np.float32).reshape(count, 5)
+
+    def frames(self, start=0, stop=None):
+        for number in range(*slice(start, stop).indices(len(self))):
+            yield self.frame(number)
+
+    def body(self, body, start=0, stop=None):
+        """
+        The history of one body (an index into each step's records) as (steps, records), for the steps it was
+        there for.
+        """
+        entries = self.index[start:stop]
+        present = entries['count'] > body
+        rows = entries['offset'][present] + body
+        return entries['step'][present], self.records[rows].view(np.float32).reshape(-1, 5)
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+from ball import Ball
+from game.bat import Bat, ControlScheme
+from game.wall import Wall
+from game.world import BounceWorld
+from pit.world import PitWorld
+
+"""
+Scene files - a world's layout saved to disk so it can be loaded instead of being built in code.
+
+A scene is two files side by side: a small JSON manifest saying what kind of world it is and holding its few
+settings (size, gravity, stiffness), and a .npz of NumPy arrays holding every body in it, one row per body. Loading
+reads each array in one go and hands it straight to the world - a pit's arrays become the PitWorld's own, and a
+bounce world's balls are made with Ball.many - so a scene of a hundred thousand bodies loads in well under a second.
+
+    save_scene('level.json', world)
+    world = load_scene('level.json')
+
+    python -m sim.scene pit big_pit.json --balls 100000
+    python -m sim.scene load big_pit.json
+"""
+
+FORMAT = 'bounce-physics-scene'
+VERSION = 1
+
+
+def arrays_path(path):
+    return os.path.splitext(path)[0] + '.npz'
+
+
+def save_scene(path, world):
+    if isinstance(world, PitWorld):
+        manifest = {'kind': 'pit', 'width': world.width, 'height': world.height, 'stiffness': world.stiffness}
+        arrays = {'positions': world.pos, 'radii': world.radius, 'colours': world.colour}
+    else:
+        manifest = {'kind': 'bounce'}
+        arrays = {
+            'walls': np.array([(wall.rect.left, wall.rect.top, wall.rect.right, wall.rect.bottom)
+                               for wall in world.walls], dtype=np.int32).reshape(-1, 4),
+            'wall_bounce_factors': np.array([wall.bounce_factor for wall in world.walls], dtype=np.float64),
+            'bats': np.array([bat.position for bat in world.bats], dtype=np.float64).reshape(-1, 2),
+            'bat_rotations': np.array([bat.rotation for bat in world.bats], dtype=np.float64),
+            'bat_bounce_factors': np.array([bat.bounce_factor for bat in world.bats], dtype=np.float64),
+            'ball_positions': np.array([ball.position for ball in world.balls], dtype=np.float64).reshape(-1, 2),
+            'ball_start_positions': np.array([ball.start_position for ball in world.balls],
+                                             dtype=np.float64).reshape(-1, 2),
+            'ball_velocities': np.array([ball.velocity for ball in world.balls], dtype=np.float64).reshape(-1, 2),
+            'ball_colours': np.array([tuple(ball.ball_colour) for ball in world.balls],
+                                     dtype=np.uint8).reshape(-1, 4),
+            'ball_radii': np.array([ball.radius for ball in world.balls], dtype=np.float64),
+        }
+
+    manifest.update({
+        'format': FORMAT,
+        'version': VERSION,
+        'gravity': [float(world.gravity[0]), float(world.gravity[1])],
+        'arrays': os.path.basename(arrays_path(path)),
+        'counts': {name: len(array) for name, array in arrays.items()},
+    })
+    # uncompressed, so loading is just reading the arrays back in
+    np.savez(arrays_path(path), **arrays)
+    with open(path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+
+def read_manifest(path):
+    with open(path) as file:
+        manifest = json.load(file)
+    if manifest.get('format') != FORMAT:
+        raise ValueError('{} is not a scene file'.format(path))
+    if manifest.get('version') != VERSION:
+        raise ValueError('{} is a version {} scene, only version {} can be loaded'.format(
+            path, manifest.get('version'), VERSION))
+    return manifest
+
+
+def check_kind(path, kind, manifest=None):
+    # a ValueError saying what kind of scene it is if it isn't this kind
+    if manifest is None:
+        manifest = read_manifest(path)
+    if manifest['kind'] != kind:
+        raise ValueError('{} is a {} scene, not a {} one'.format(path, manifest['kind'], kind))
+
+
+def load_scene(path, kind=None, **kwargs):
+    """
+    Builds the world a scene file describes. Any keyword arguments are passed on to the world, for settings that
+    aren't part of the scene (sleeping, continuous_collision and so on), so a caller that passes any should say
+    which kind of scene ('bounce' or 'pit') it expects - loading any other kind is then a ValueError saying what
+    kind it is, rather than the world being handed settings it doesn't have.
+    """
+    manifest = read_manifest(path)
+    if kind is not None:
+        check_kind(path, kind, manifest)
+
+    with np.load(os.path.join(os.path.dirname(path), manifest['arrays'])) as arrays:
+        if manifest['kind'] == 'pit':
+            kwargs.setdefault('stiffness', manifest['stiffness'])
+            return PitWorld(manifest['width'], manifest['height'], arrays['positions'], arrays['radii'],
+                            arrays['colours'], gravity=manifest['gravity'], **kwargs)
+        if manifest['kind'] == 'bounce':
+            walls = [Wall((left, top), (right, bottom)) for left, top, right, bottom in arrays['walls'].tolist()]
+            bats = [Bat(position, ControlScheme()) for position in arrays['bats'].tolist()]
+            # scenes saved before balls had a radius have every ball the standard size
+            radii = arrays['ball_radii'].tolist() if 'ball_radii' in arrays else None
+            balls = Ball.many(arrays['ball_positions'].tolist(), [tuple(colour) for colour in
+                                                                   arrays['ball_colours'].tolist()],
+                              arrays['ball_velocities'].tolist(), radii=radii)
+            # and before the rest of these were saved, everything was as it is when first made, and each ball
+            # started where it was saved
+            if 'wall_bounce_factors' in arrays:
+                for wall, bounce_factor in zip(walls, arrays['wall_bounce_factors'].tolist()):
+                    wall.bounce_factor = bounce_factor
+            if 'bat_rotations' in arrays:
+                for bat, rotation, bounce_factor in zip(bats, arrays['bat_rotations'].tolist(),
+                                                        arrays['bat_bounce_factors'].tolist()):
+                    bat.rotate(rotation)
+                    bat.previous_rotation = rotation
+                    bat.bounce_factor = bounce_factor
+            if 'ball_start_positions' in arrays:
+                for ball, start_position in zip(balls, arrays['ball_start_positions'].tolist()):
+                    ball.start_position = start_position
+            return BounceWorld(walls, bats, balls, gravity=manifest['gravity'], **kwargs)
+    raise ValueError('{} has an unknown kind of scene: {}'.format(path, manifest['kind']))
+
+
+def bounce_scene(balls=1, seed=None):
+    """
+    The default bounce layout with this many balls scattered around inside it.
+    """
+    world = BounceWorld.default(seed=seed)
+    if balls != 1:
+        rng = np.random.default_rng(seed)
+        positions = np.empty((balls, 2))
+        positions[:, 0] = rng.uniform(30, 760, balls)
+        positions[:, 1] = rng.uniform(30, 450, balls)
+        world.balls = Ball.many(positions.tolist(), [(255, 255, 255, 255)] * balls, rng=world.rng)
+    return world
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write or load scene files.')
+    parser.add_argument('command', choices=['pit', 'bounce', 'load'])
+    parser.add_argument('path')
+    parser.add_argument('--balls', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'load':
+        start = time.perf_counter()
+        world = load_scene(args.path)
+        seconds = time.perf_counter() - start
+        bodies = len(world) if isinstance(world, PitWorld) else len(world.walls) + len(world.bats) + len(world.balls)
+        print('Loaded {} bodies in {:.3f}s'.format(bodies, seconds))
+        return
+
+    if args.command == 'pit':
+        world = PitWorld.default(args.balls, args.seed)
+    else:
+        world = bounce_scene(args.balls, args.seed)
+    save_scene(args.path, world)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+import math
+import struct
+import asyncio
+import argparse
+
+import numpy as np
+
+from ball import Ball
+from game.world import BounceWorld
+from pit.world import PitWorld
+from sim.clock import FixedStepClock
+from sim.recorder import RECORD, bounce_state, pit_state
+from sim.scene import load_scene
+
+"""
+Hosts any number of worlds behind a local socket, stepping them on a fixed tick and streaming their state to clients.
+
+Everything runs on one asyncio event loop. A tick task steps every world with a FixedStepClock, so the simulation
+keeps to real time (and drops time rather than spiralling if a tick overruns). Input from clients - bats being
+steered, balls spawned, pit balls dragged with the mouse - is queued as it arrives and applied at the start of the
+next step, so it always lands between steps.
+
+After the steps of each tick, every world's state is taken as one row per body in the same five float32 fields a
+trajectory recording uses (x, y, velocity x, velocity y, rotation; bats first, then balls). Each world encodes two
+messages from it at most once per tick however many clients there are: a delta holding only the rows that changed
+since the last tick, and - only if some client needs it - a keyframe holding every row.
+
+A client that is keeping up gets the delta every tick. Each client has a single slot per world for the message
+waiting to go out, and its own writer task that empties the slots onto the socket and waits for the socket to drain.
+The tick never waits for anyone: if a client's last message is still in its slot when the next tick comes round, the
+client has fallen behind, so the waiting message is swapped for a keyframe of the new tick. A slow client therefore
+only ever costs one message of memory per world and just sees fewer ticks, and the rest are unaffected.
+
+Messages both ways are a little endian uint32 length followed by that many bytes, the first of which says what kind
+of message it is (see the constants below).
+
+    python -m sim.server --bounce 1 --pit 1 --port 8765
+    python -m sim.client --port 8765 --subscribers 200 --seconds 10
+"""
+
+# client to server
+SUBSCRIBE = 1       # world id: uint16
+UNSUBSCRIBE = 2     # world id: uint16
+BAT = 3             # world id: uint16, bat: uint16, flags: uint8 (BAT_LEFT | BAT_RIGHT | ...)
+SPAWN = 4           # world id: uint16, x, y: float32 - a new ball in a bounce world
+DRAG = 5            # world id: uint16, phase: uint8 (DRAG_PRESS, DRAG_MOVE or DRAG_RELEASE), x, y: float32
+
+# server to client
+WORLDS = 16         # count: uint16, then for each world id: uint16, kind: uint8, dt: float32
+KEYFRAME = 17       # world id: uint16, tick: uint64, rows: uint32, bats: uint32, then rows RECORDs
+DELTA = 18          # world id: uint16, tick: uint64, changed: uint32, then changed uint32 row numbers and RECORDs
+ERROR = 19          # a utf-8 message
+
+BAT_LEFT, BAT_RIGHT, BAT_ROTATE_LEFT, BAT_ROTATE_RIGHT = 1, 2, 4, 8
+DRAG_PRESS, DRAG_MOVE, DRAG_RELEASE = 0, 1, 2
+BOUNCE_KIND, PIT_KIND = 0, 1
+
+LENGTH = struct.Struct('<I')
+WORLD_ID = struct.Struct('<H')
+BAT_INPUT = struct.Struct('<HHB')
+SPAWN_INPUT = struct.Struct('<Hff')
+DRAG_INPUT = struct.Struct('<HBff')
+WORLD_ENTRY = struct.Struct('<HBf')
+FRAME_HEADER = struct.Struct('<BHQII')
+DELTA_HEADER = struct.Struct('<BHQI')
+
+# nothing a client sends is anywhere near this long, so anything longer is a broken or hostile client
+MAX_MESSAGE = 1024
+
+
+def frame(payload):
+    return LENGTH.pack(len(payload)) + payload
+
+
+class HostedWorld:
+    """
+    One world on the server, with what it needs to hand its state out: the last tick's state, the inputs waiting for
+    the next step, and the connections subscribed to it.
+    """
+    def __init__(self, world_id, world, dt, iterations=5):
+        self.id = world_id
+        self.world = world
+        self.dt = dt
+        self.iterations = iterations
+        self.kind = PIT_KIND if isinstance(world, PitWorld) else BOUNCE_KIND
+        self.inputs = []
+        self.subscribers = set()
+
+        self.tick = 0
+        self.state, self.bats = self.capture()
+        self.delta = None
+        self._keyframe = None
+
+    def capture(self):
+        if self.kind == PIT_KIND:
+            state, bats = pit_state(self.world, self.dt)
+        else:
+            state, bats = bounce_state(self.world, self.dt)
+        return np.ascontiguousarray(state).view(RECORD).reshape(-1), bats
+
+    def step(self):
+        for connection, apply in self.inputs:
+            try:
+                apply(self.world)
+            except Exception as error:
+                # one bad input is the sender's problem, not every other client's, so the tick carries on
+                connection.send(bytes((ERROR,)) + 'world {}: {!r}'.format(self.id, error).encode('utf-8'))
+        self.inputs.clear()
+        if self.kind == PIT_KIND:
+            self.world.step(self.dt, self.iterations)
+        else:
+            self.world.step(self.dt)
+
+    def publish(self):
+        """
+        Takes the world's state for a new tick and encodes the delta from the last one. The keyframe is left until
+        someone asks for it.
+        """
+        state, bats = self.capture()
+        self.tick += 1
+        if len(state) == len(self.state) and bats == self.bats:
+            changed = np.flatnonzero(state != self.state).astype('<u4')
+            self.delta = frame(DELTA_HEADER.pack(DELTA, self.id, self.tick, len(changed)) + changed.tobytes() +
+                               state.take(changed).tobytes())
+        else:
+            # bodies have come or gone, so rows can't be matched up with last tick's
+            self.delta = None
+        self.state, self.bats = state, bats
+        self._keyframe = None
+
+    def keyframe(self):
+        if self._keyframe is None:
+            self._keyframe = frame(FRAME_HEADER.pack(KEYFRAME, self.id, self.tick, len(self.state), self.bats) +
+                                   self.state.tobytes())
+        return self._keyframe
+
+
+class Connection:
+    """
+    One client. Holds the message waiting to go out for each world it is subscribed to and writes them out on its own
+    task, so a client that reads slowly only holds itself up.
+    """
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.messages = []
+        self.pending = {}
+        self.queued_tick = {}
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def offer(self, hosted):
+        # a delta is only any use to a client that has been handed the tick before it
+        if (hosted.delta is None or hosted.id in self.pending or
+                self.queued_tick.get(hosted.id) != hosted.tick - 1):
+            self.pending[hosted.id] = hosted.keyframe()
+        else:
+            self.pending[hosted.id] = hosted.delta
+        self.queued_tick[hosted.id] = hosted.tick
+        self.ready.set()
+
+    def send(self, payload):
+        # replies like the world list and errors, which always go out, ahead of any state
+        self.messages.append(frame(payload))
+        self.ready.set()
+
+    async def write_loop(self):
+        while not self.closed:
+            await self.ready.wait()
+            self.ready.clear()
+            messages = self.messages + list(self.pending.values())
+            self.messages = []
+            self.pending.clear()
+            self.writer.write(b''.join(messages))
+            await self.writer.drain()
+
+    async def read_loop(self):
+        while True:
+            length, = LENGTH.unpack(await self.reader.readexactly(LENGTH.size))
+            if length == 0 or length > MAX_MESSAGE:
+                raise ValueError('message of {} bytes'.format(length))
+            message = await self.reader.readexactly(length)
+            try:
+                self.server.handle(self, message[0], message[1:])
+            except (ValueError, IndexError, KeyError, struct.error) as error:
+                self.send(bytes((ERROR,)) + str(error).encode('utf-8'))
+
+    def subscribe(self, hosted):
+        hosted.subscribers.add(self)
+        self.queued_tick.pop(hosted.id, None)
+        # sent straight away rather than waiting for the next tick
+        self.offer(hosted)
+
+    def unsubscribe(self, hosted):
+        hosted.subscribers.discard(self)
+        self.pending.pop(hosted.id, None)
+        self.queued_tick.pop(hosted.id, None)
+
+
+class SimulationServer:
+    def __init__(self, worlds, dt=1 / 60, iterations=5, max_steps=5):
+        self.dt = dt
+        self.worlds = [HostedWorld(world_id, world, dt, iterations) for world_id, world in enumerate(worlds)]
+        self.clock = FixedStepClock(dt, max_steps)
+        self.connections = set()
+        self.handlers = set()
+        self.servers = []
+        self.ticks = 0
+
+    async def listen(self, host='127.0.0.1', port=8765, unix_path=None, backlog=1024):
+        # the backlog is big enough for hundreds of clients to all connect at once while a tick is running
+        if unix_path is not None:
+            self.servers.append(await asyncio.start_unix_server(self.accept, unix_path, backlog=backlog))
+        if port is not None:
+            self.servers.append(await asyncio.start_server(self.accept, host, port, backlog=backlog))
+        return self.servers
+
+    async def run(self, duration=None):
+        """
+        Steps the worlds in real time, forever or for duration seconds.
+        """
+        loop = asyncio.get_running_loop()
+        started = last = loop.time()
+        deadline = started
+        while duration is None or last - started < duration:
+            deadline += self.dt
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+            now = loop.time()
+            steps = self.clock.advance(now - last)
+            last = now
+            if steps:
+                self.tick(steps)
+            if now - deadline > self.clock.max_steps * self.dt:
+                # the clock has already dropped the time it couldn't make up, so start counting again from now
+                deadline = now
+
+    def tick(self, steps=1):
+        for hosted in self.worlds:
+            for _ in range(steps):
+                hosted.step()
+            hosted.publish()
+            for connection in hosted.subscribers:
+                connection.offer(hosted)
+        self.ticks += 1
+
+    async def accept(self, reader, writer):
+        connection = Connection(self, reader, writer)
+        self.connections.add(connection)
+        self.handlers.add(asyncio.current_task())
+        entries = b''.join(WORLD_ENTRY.pack(hosted.id, hosted.kind, hosted.dt) for hosted in self.worlds)
+        connection.send(bytes((WORLDS,)) + WORLD_ID.pack(len(self.worlds)) + entries)
+        # whichever ends first - the client hanging up, sending rubbish or no longer being written to - ends both
+        tasks = [asyncio.ensure_future(connection.write_loop()), asyncio.ensure_future(connection.read_loop())]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self.drop(connection)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.handlers.discard(asyncio.current_task())
+
+    def drop(self, connection):
+        connection.closed = True
+        for hosted in self.worlds:
+            hosted.subscribers.discard(connection)
+        self.connections.discard(connection)
+        connection.writer.close()
+
+    def handle(self, connection, kind, body):
+        if kind == SUBSCRIBE:
+            connection.subscribe(self.world(*WORLD_ID.unpack(body)))
+        elif kind == UNSUBSCRIBE:
+            connection.unsubscribe(self.world(*WORLD_ID.unpack(body)))
+        elif kind == BAT:
+            world_id, bat, flags = BAT_INPUT.unpack(body)
+            hosted = self.world(world_id, BOUNCE_KIND)
+            if bat >= len(hosted.world.bats):
+                raise ValueError('world {} has no bat {}'.format(world_id, bat))
+            hosted.inputs.append((connection, lambda world: steer(world.bats[bat], flags)))
+        elif kind == SPAWN:
+            world_id, x, y = SPAWN_INPUT.unpack(body)
+            hosted = self.world(world_id, BOUNCE_KIND)
+            check_position(x, y)
+            hosted.inputs.append((connection, lambda world: spawn_ball(world, x, y)))
+        elif kind == DRAG:
+            world_id, phase, x, y = DRAG_INPUT.unpack(body)
+            hosted = self.world(world_id, PIT_KIND)
+            if phase not in (DRAG_PRESS, DRAG_MOVE, DRAG_RELEASE):
+                raise ValueError('unknown drag phase {}'.format(phase))
+            check_position(x, y)
+            hosted.inputs.append((connection, lambda world: drag(world, phase, x, y)))
+        else:
+            raise ValueError('unknown message type {}'.format(kind))
+
+    def world(self, world_id, kind=None):
+        if world_id >= len(self.worlds):
+            raise ValueError('no world {}'.format(world_id))
+        hosted = self.worlds[world_id]
+        if kind is not None and hosted.kind != kind:
+            raise ValueError('world {} is the wrong kind of world for that'.format(world_id))
+        return hosted
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+        for connection in list(self.connections):
+            self.drop(connection)
+        # dropping a connection ends its handler, but only once the handler has had a chance to run
+        await asyncio.gather(*self.handlers, return_exceptions=True)
+
+
+def check_position(x, y):
+    # a NaN or an infinity would get as far as the middle of a step before anything choked on it
+    if not (math.isfinite(x) and math.isfinite(y)):
+        raise ValueError('position ({}, {}) is not a finite point'.format(x, y))
+
+
+def steer(bat, flags):
+    bat.move_left = bool(flags & BAT_LEFT)
+    bat.move_right = bool(flags & BAT_RIGHT)
+    bat.rotate_left = bool(flags & BAT_ROTATE_LEFT)
+    bat.rotate_right = bool(flags & BAT_ROTATE_RIGHT)
+
+
+def spawn_ball(world, x, y):
+    # coloured the same way bounce_physics.py colours the balls it spawns
+    colour = (world.rng.randint(100, 255), world.rng.randint(100, 255), world.rng.randint(100, 255), 255)
+    world.balls.append(Ball((x, y), colour, world.rng))
+
+
+def drag(world, phase, x, y):
+    if phase == DRAG_PRESS:
+        picked = world.pick((x, y))
+        if picked >= 0:
+            world.hold(picked, (x, y))
+    elif phase == DRAG_MOVE:
+        if world.held_index >= 0:
+            world.held_position = (x, y)
+    else:
+        world.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Host simulations for clients on a local socket.')
+    parser.add_argument('--bounce', type=int, default=1, help='how many bounce worlds to host')
+    parser.add_argument('--pit', type=int, default=0, help='how many ball pits to host')
+    parser.add_argument('--balls', type=int, default=30, help='number of balls in each pit')
+    parser.add_argument('--scene', nargs='*', default=[], help='host the worlds in these scene files as well')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--dt', type=float, default=1 / 60)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this unix socket as well')
+    args = parser.parse_args()
+
+    # every world gets its own seed from the one given, so they don't all play out the same
+    seeds = range(args.seed, args.seed + args.bounce + args.pit) if args.seed is not None else [None] * (
+        args.bounce + args.pit)
+    worlds = [BounceWorld.default(seed=seed) for seed in seeds[:args.bounce]]
+    worlds += [PitWorld.default(args.balls, seed) for seed in seeds[args.bounce:]]
+    worlds += [load_scene(path) for path in args.scene]
+
+    async def serve():
+        server = SimulationServer(worlds, args.dt)
+        await server.listen(args.host, args.port, args.unix)
+        print('Hosting {} worlds on {}:{}'.format(len(worlds), args.host, args.port))
+        try:
+            await server.run()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
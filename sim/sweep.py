@@ -0,0 +1,154 @@
+import os
+import sys
+import json
+import argparse
+import itertools
+import multiprocessing
+
+from game.world import BounceWorld
+from sim.headless import default_pit
+
+"""
+Parameter sweeps over many independent worlds at once.
+
+Every (parameters, seed) combination is a separate job for a process pool. Only the plain parameter dictionary goes
+to a worker and only a dictionary of metrics comes back, so no pygame objects are ever pickled; each worker builds
+its own world from scratch. Results are yielded as soon as each world finishes, in whatever order they finish.
+
+    python -m sim.sweep pit --stiffness 0.3 0.5 0.7 --iterations 3 5 --seeds 0 1 2 --steps 600
+"""
+
+# speeds below this (in pixels per second) count as being at rest
+REST_SPEED = 5.0
+
+
+def parameter_grid(**axes):
+    """
+    Turns lists of values for each parameter into every combination of them, e.g.
+
+        parameter_grid(stiffness=[0.3, 0.5], iterations=[3, 5]) -> four parameter dictionaries
+    """
+    names = sorted(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+def run_sweep(simulation, parameter_sets, seeds=(0,), steps=600, dt=1 / 60, sample_every=10, processes=None):
+    """
+    Runs every parameter set with every seed across a pool of worker processes (one per core by default) and
+    yields each world's metrics dictionary as it completes.
+    """
+    jobs = [(simulation, parameters, seed, steps, dt, sample_every)
+            for parameters in parameter_sets for seed in seeds]
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    # handing jobs out a few at a time keeps the queue overhead down without leaving cores idle at the end
+    chunk_size = max(1, len(jobs) // (processes * 4))
+    with multiprocessing.Pool(processes) as pool:
+        for metrics in pool.imap_unordered(run_job, jobs, chunk_size):
+            yield metrics
+
+
+def run_job(job):
+    simulation, parameters, seed, steps, dt, sample_every = job
+    if simulation == 'bounce':
+        metrics = measure_bounce(parameters, seed, steps, dt, sample_every)
+    elif simulation == 'pit':
+        metrics = measure_pit(parameters, seed, steps, dt, sample_every)
+    else:
+        raise ValueError('Unknown simulation: ' + str(simulation))
+
+    metrics['simulation'] = simulation
+    metrics['parameters'] = parameters
+    metrics['seed'] = seed
+    return metrics
+
+
+def measure_bounce(parameters, seed, steps, dt, sample_every):
+    world = BounceWorld.default(seed=seed)
+    if 'gravity' in parameters:
+        world.gravity = [0.0, float(parameters['gravity'])]
+    for wall in world.walls:
+        wall.bounce_factor = parameters.get('wall_bounce_factor', wall.bounce_factor)
+    for bat in world.bats:
+        bat.bounce_factor = parameters.get('bat_bounce_factor', bat.bounce_factor)
+
+    resting_steps = 0
+    energy = []
+    for step in range(steps):
+        world.step(dt)
+
+        if all(ball.velocity[0] == 0.0 and ball.velocity[1] == 0.0 for ball in world.balls):
+            resting_steps += 1
+        if step % sample_every == 0:
+            energy.append(bounce_energy(world))
+
+    return {'bounces': world.total_bounces(), 'resting_time': resting_steps * dt, 'energy': energy}
+
+
+def bounce_energy(world):
+    # kinetic plus potential energy per unit mass, summed over every ball
+    energy = 0.0
+    for ball in world.balls:
+        energy += 0.5 * (ball.velocity[0] ** 2 + ball.velocity[1] ** 2)
+        energy -= world.gravity[0] * ball.position[0] + world.gravity[1] * ball.position[1]
+    return energy
+
+
+def measure_pit(parameters, seed, steps, dt, sample_every):
+    world = default_pit(parameters.get('balls', 30), seed)
+    world.stiffness = parameters.get('stiffness', world.stiffness)
+    if 'gravity' in parameters:
+        world.gravity[:] = (0.0, float(parameters['gravity']))
+    iterations = parameters.get('iterations', 5)
+
+    resting_steps = 0
+    energy = []
+    for step in range(steps):
+        world.step(dt, iterations)
+
+        speeds = pit_speeds(world, dt)
+        if speeds.max(initial=0.0) < REST_SPEED:
+            resting_steps += 1
+        if step % sample_every == 0:
+            potential = -(world.pos @ world.gravity)
+            energy.append(float(world.mass @ (0.5 * speeds * speeds + potential)))
+
+    return {'bounces': 0, 'resting_time': resting_steps * dt, 'energy': energy}
+
+
+def pit_speeds(world, dt):
+    # Verlet bodies don't store a velocity, it is implied by how far they moved over the last step
+    moved = world.pos - world.prev_pos
+    return (moved[:, 0] ** 2 + moved[:, 1] ** 2) ** 0.5 / dt
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep simulation parameters across all cores.')
+    parser.add_argument('simulation', choices=['bounce', 'pit'])
+    parser.add_argument('--stiffness', type=float, nargs='+')
+    parser.add_argument('--gravity', type=float, nargs='+')
+    parser.add_argument('--iterations', type=int, nargs='+')
+    parser.add_argument('--wall-bounce-factor', type=float, nargs='+')
+    parser.add_argument('--bat-bounce-factor', type=float, nargs='+')
+    parser.add_argument('--balls', type=int, nargs='+')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--steps', type=int, default=600)
+    parser.add_argument('--dt', type=float, default=1 / 60)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    axes = {}
+    for name in ('stiffness', 'gravity', 'iterations', 'wall_bounce_factor', 'bat_bounce_factor', 'balls'):
+        if getattr(args, name) is not None:
+            axes[name] = getattr(args, name)
+
+    # one JSON object per line, written as each world finishes
+    for metrics in run_sweep(args.simulation, parameter_grid(**axes), args.seeds, args.steps, args.dt,
+                             processes=args.processes):
+        sys.stdout.write(json.dumps(metrics) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()